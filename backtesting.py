@@ -0,0 +1,225 @@
+"""Rolling-origin backtesting over time-ordered folds.
+
+Folds are cut on the distinct timestamps of the feature frame. Every fold
+trains on periods up to its cutoff and is scored on the `horizon` periods
+that follow, so no model ever sees the future it is evaluated on:
+
+- expanding: training always starts at the first period
+- sliding:   training covers only the last `train_periods` periods
+
+The feature frame is cached once and the folds are fitted concurrently from
+a thread pool on the same SparkSession. Each fold's model forecasts the test
+periods by recursive rollout from the cutoff (see forecast.py): the lag and
+rolling features of step h are built from the model's own predictions for
+steps 1..h-1, never from actuals after the cutoff. Other inputs, such as
+weather, are taken as observed. Metrics are reported per fold and per
+horizon step (1 = first period after the cutoff), so horizon h is the error
+of a forecast issued h periods ahead.
+"""
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import abs as abs_, broadcast, col, concat_ws, count, lit, sum as sum_
+
+from calendar_features import calendar_feature_names
+from feature_engine import DEFAULT_LAGS, DEFAULT_WINDOWS, feature_names, series_keys
+from forecast import recursive_forecast, recursive_forecast_pandas
+
+FOLD_TYPES = ("expanding", "sliding")
+
+# series column of a multi-origin rollout: one series per (series, origin)
+ROLLOUT_KEY = "_rollout"
+
+
+def distinct_periods(df, time_col="timestamp"):
+    return [r[0] for r in df.select(time_col).distinct().orderBy(time_col).collect()]
+
+
+def split_cutoff(periods, test_fraction=0.2):
+    """Last training period when the final `test_fraction` of the sorted `periods` is held out."""
+    if len(periods) < 2:
+        raise ValueError("Need at least two distinct periods for a time-ordered split")
+    n_train = min(max(int(round(len(periods) * (1 - test_fraction))), 1), len(periods) - 1)
+    return periods[n_train - 1]
+
+
+def time_split(df, test_fraction=0.2, time_col="timestamp"):
+    """Split into train/test on time: the last `test_fraction` of periods form the test set."""
+    cutoff = split_cutoff(distinct_periods(df, time_col), test_fraction)
+    return df.where(col(time_col) <= lit(cutoff)), df.where(col(time_col) > lit(cutoff))
+
+
+def make_folds(periods, n_folds=3, horizon=3, fold_type="expanding", train_periods=None):
+    """Return folds as dicts of train start/cutoff and the test periods, oldest first.
+
+    Test windows do not overlap: successive cutoffs are `horizon` periods apart
+    and the last fold ends at the latest period.
+    """
+    if fold_type not in FOLD_TYPES:
+        raise ValueError(f"Unknown fold type {fold_type!r} (expected one of {FOLD_TYPES})")
+    if fold_type == "sliding" and not train_periods:
+        raise ValueError("Sliding-window folds need train_periods")
+    folds = []
+    for i in range(n_folds):
+        cutoff_idx = len(periods) - 1 - horizon * (n_folds - i)
+        start_idx = 0 if fold_type == "expanding" else cutoff_idx - train_periods + 1
+        if cutoff_idx < 0 or start_idx < 0:
+            raise ValueError(f"Not enough history for {n_folds} folds of horizon {horizon} "
+                             f"({len(periods)} periods available)")
+        folds.append({
+            "fold": i,
+            "train_start": periods[start_idx],
+            "cutoff": periods[cutoff_idx],
+            "test_periods": periods[cutoff_idx + 1:cutoff_idx + 1 + horizon],
+        })
+    return folds
+
+
+def rollout(df, model, origins, steps, features, series_col="Apartment_ID", lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+            period="1 month", calendar=None, until=None, periods=None):
+    """h-step predictions of `model` from every origin in `origins`, joined to the actuals of the feature frame `df`.
+
+    Returns (series, origin, timestamp, horizon, target, prediction) for the `steps` periods after each origin,
+    up to `until` if given. Inputs in `features` that the rollout does not rebuild (weather) are read from `df`.
+    All origins are rolled out together: every (series, origin) pair is one series of a single
+    `recursive_forecast`, so the cost is `steps` scoring jobs however many origins there are.
+    """
+    keys = series_keys(df, series_col)
+    periods = distinct_periods(df) if periods is None else periods
+    depth = max(tuple(lags) + tuple(windows))
+    # each origin reads only the lookback it needs and the periods it forecasts
+    bounds = []
+    for origin in origins:
+        i = periods.index(origin)
+        bounds.append((origin, periods[max(i - depth + 1, 0)], periods[min(i + steps, len(periods) - 1)]))
+    windows_df = broadcast(df.sparkSession.createDataFrame(bounds, "origin timestamp, _start timestamp, _end timestamp"))
+    tagged = df.join(windows_df, (col("timestamp") >= col("_start")) & (col("timestamp") <= col("_end")))
+    tagged = tagged.withColumn(ROLLOUT_KEY, concat_ws("|", *[col(k).cast("string") for k in keys],
+                                                      col("origin").cast("string")))
+
+    history = tagged.where(col("timestamp") <= col("origin")).select(ROLLOUT_KEY, "timestamp",
+                                                                    col("target").alias("power"))
+    built = set(feature_names(lags, windows)) | set(calendar_feature_names(calendar))
+    observed = [f for f in features if f not in built]
+    future = tagged.where(col("timestamp") > col("origin"))
+    exogenous = future.select(ROLLOUT_KEY, "timestamp", *observed) if observed else None
+    predictions = recursive_forecast(history, model, steps, series_col=ROLLOUT_KEY, lags=lags, windows=windows,
+                                     period=period, calendar=calendar, exogenous=exogenous)
+    actuals = future.select(ROLLOUT_KEY, *keys, "origin", "timestamp", "target")
+    if until is not None:
+        actuals = actuals.where(col("timestamp") <= lit(until))
+    return (predictions.join(actuals, on=[ROLLOUT_KEY, "timestamp"], how="inner")
+            .select(*keys, "origin", "timestamp", "horizon", "target", "prediction"))
+
+
+def rollout_pandas(pdf, model, features, origins, steps, series_col="Apartment_ID", lags=DEFAULT_LAGS,
+                   windows=DEFAULT_WINDOWS, period="1 month", calendar=None, until=None):
+    """pandas counterpart of `rollout` for a scikit-learn `model`, batching the origins the same way."""
+    keys = [series_col] if series_col and series_col in pdf.columns else []
+    columns = [*keys, "origin", "timestamp", "horizon", "target", "prediction"]
+    periods = list(np.sort(pdf["timestamp"].dropna().unique()))
+    depth = max(tuple(lags) + tuple(windows))
+    tagged = []
+    for origin in origins:
+        i = periods.index(origin)
+        start, end = periods[max(i - depth + 1, 0)], periods[min(i + steps, len(periods) - 1)]
+        part = pdf[(pdf["timestamp"] >= start) & (pdf["timestamp"] <= end)]
+        key = part[series_col].astype(str) + "|" + str(origin) if keys else str(origin)
+        tagged.append(part.assign(origin=origin, **{ROLLOUT_KEY: key}))
+    if not tagged:
+        return pd.DataFrame(columns=columns)
+    tagged = pd.concat(tagged, ignore_index=True)
+
+    history = tagged.loc[tagged["timestamp"] <= tagged["origin"], [ROLLOUT_KEY, "timestamp", "target"]]
+    built = set(feature_names(lags, windows)) | set(calendar_feature_names(calendar))
+    observed = [f for f in features if f not in built]
+    future = tagged[tagged["timestamp"] > tagged["origin"]]
+    exogenous = future[[ROLLOUT_KEY, "timestamp", *observed]] if observed else None
+    predictions = recursive_forecast_pandas(history.rename(columns={"target": "power"}), model, features, steps,
+                                            series_col=ROLLOUT_KEY, lags=lags, windows=windows, period=period,
+                                            calendar=calendar, exogenous=exogenous)
+    actuals = future[[ROLLOUT_KEY, *keys, "origin", "timestamp", "target"]]
+    if until is not None:
+        actuals = actuals[actuals["timestamp"] <= until]
+    return predictions.merge(actuals, on=[ROLLOUT_KEY, "timestamp"], how="inner")[columns]
+
+
+def _fit_and_score(df, fold, build_pipeline, features, time_col, rollout_args):
+    spark = df.sparkSession
+    # one scheduler pool per fold so concurrent fits share executors under FAIR scheduling
+    spark.sparkContext.setLocalProperty("spark.scheduler.pool", f"fold{fold['fold']}")
+    train = df.where((col(time_col) >= lit(fold["train_start"])) & (col(time_col) <= lit(fold["cutoff"])))
+
+    model = build_pipeline(features).fit(train)
+    err = col("prediction") - col("target")
+    rows = (
+        rollout(df, model, [fold["cutoff"]], len(fold["test_periods"]), features, **rollout_args)
+        .groupBy("horizon")
+        .agg(count(lit(1)).alias("n"), sum_(err * err).alias("sse"), sum_(abs_(err)).alias("sae"))
+        .orderBy("horizon")
+        .collect()
+    )
+
+    # fold totals come from the per-horizon sums, so scoring is a single pass
+    n = sum(r["n"] for r in rows)
+    result = {
+        "fold": fold["fold"],
+        "train_start": str(fold["train_start"]),
+        "cutoff": str(fold["cutoff"]),
+        "test_rows": n,
+        "RMSE": math.sqrt(sum(r["sse"] for r in rows) / n) if n else None,
+        "MAE": sum(r["sae"] for r in rows) / n if n else None,
+        "by_horizon": [
+            {"horizon": r["horizon"], "rows": r["n"], "RMSE": math.sqrt(r["sse"] / r["n"]), "MAE": r["sae"] / r["n"]}
+            for r in rows
+        ],
+    }
+    return result
+
+
+def run_backtest(df, build_pipeline, features, n_folds=3, horizon=3, fold_type="expanding",
+                 train_periods=None, parallelism=None, time_col="timestamp", series_col="Apartment_ID",
+                 lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, period="1 month", calendar=None):
+    """Fit one pipeline per fold concurrently and return per-fold and per-horizon metrics.
+
+    `build_pipeline(features)` must return an unfitted Pipeline that reads the
+    `target` column and writes `prediction`. `lags`, `windows`, `period` and
+    `calendar` must match the ones `df` was built with, so the rollout rebuilds
+    the same features.
+    """
+    df = df.persist()
+    try:
+        periods = distinct_periods(df, time_col)
+        rollout_args = dict(series_col=series_col, lags=lags, windows=windows, period=period, calendar=calendar,
+                            periods=periods)
+        folds = make_folds(periods, n_folds, horizon, fold_type, train_periods)
+        with ThreadPoolExecutor(max_workers=parallelism or len(folds)) as pool:
+            results = list(pool.map(lambda f: _fit_and_score(df, f, build_pipeline, features, time_col, rollout_args),
+                                    folds))
+    finally:
+        df.unpersist()
+
+    summary = {"fold_type": fold_type, "folds": results, "by_horizon": []}
+    for h in range(1, horizon + 1):
+        cells = [b for r in results for b in r["by_horizon"] if b["horizon"] == h]
+        n = sum(b["rows"] for b in cells)
+        if n:
+            summary["by_horizon"].append({
+                "horizon": h,
+                "rows": n,
+                "RMSE": math.sqrt(sum(b["RMSE"] ** 2 * b["rows"] for b in cells) / n),
+                "MAE": sum(b["MAE"] * b["rows"] for b in cells) / n,
+            })
+    return summary
+
+
+def write_report(summary, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, "backtest_metrics.json")
+    with open(path, "w") as fh:
+        json.dump(summary, fh, indent=2)
+    return path
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Synthetic-data benchmark for each stage of forecasting_app.py.
+
+Generates power data in the bundled Year/Month/Season/Monthly_kWh/Apartment_ID
+layout (plus a matching weather CSV) with Spark, so sizes up to 10^8 rows never
+pass through the driver, then times every pipeline stage separately:
+
+  generate   write the synthetic CSVs (without it, data generated earlier
+             for the same size, months, seed and weather setting is reused)
+  load       load_csv without the Parquet cache (CSV parse)
+  cache      load_csv populating the Parquet cache
+  features   create_features, materialized with the no-op sink
+  train      train_and_evaluate (fit, evaluate, write predictions and model)
+
+Usage (example):
+  python benchmark.py --sizes 1000,100000,10000000 --out outputs/benchmark/results_$(git rev-parse --short HEAD).json
+  python benchmark.py --sizes 100000000 --stages load,cache,features
+
+Results are written as JSON (one record per size with seconds per stage, plus
+the git commit), so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import (array, col, concat, cos, element_at, floor, lit, lpad, pmod, rand, randn,
+                                   round as round_, sin)
+
+import forecasting_app
+from calendar_features import SEASON_BY_MONTH
+
+STAGES = ("generate", "load", "cache", "features", "train")
+
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+# calendar_features seasons, spelled like the bundled CSV (e.g. Summer_Peak)
+SEASONS = ["_".join(w.capitalize() for w in SEASON_BY_MONTH[m].split("_")) for m in range(1, 13)]
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated row counts (e.g. 1e3,1e6,1e8)")
+    p.add_argument("--history-months", type=int, default=120, help="Months of history per series")
+    p.add_argument("--stages", default=",".join(STAGES), help=f"Stages to time (subset of {','.join(STAGES)})")
+    p.add_argument("--no-weather", action="store_true", help="Benchmark without the weather CSV and join")
+    p.add_argument("--work-dir", default="outputs/benchmark", help="Scratch directory for generated data and outputs")
+    p.add_argument("--out", default="outputs/benchmark/results.json", help="JSON file to write results to")
+    p.add_argument("--seed", type=int, default=42)
+    return p.parse_args()
+
+
+def generate_power(spark, rows, months, seed=42):
+    """Synthetic monthly consumption for rows // months apartments, in the bundled CSV layout."""
+    n_series = max(rows // months, 1)
+    ids = spark.range(n_series * months)
+    series = floor(col("id") / months)
+    offset = pmod(col("id"), lit(months))
+    month_idx = pmod(offset, lit(12))
+    # per-apartment base load, yearly seasonality and noise
+    base = 250 + pmod(series * 7919, lit(200))
+    seasonal = 60 * sin(month_idx * 3.14159265 / 6) + 25 * cos(month_idx * 3.14159265 / 3)
+    return ids.select(
+        concat(lit("Apt_"), (series + 1).cast("string")).alias("Apartment_ID"),
+        (2015 + floor(offset / 12)).cast("int").alias("Year"),
+        element_at(array(*[lit(m) for m in MONTH_NAMES]), (month_idx + 1).cast("int")).alias("Month"),
+        element_at(array(*[lit(s) for s in SEASONS]), (month_idx + 1).cast("int")).alias("Season"),
+        round_(base + seasonal + 10 * randn(seed) + 5 * rand(seed + 1)).cast("int").alias("Monthly_kWh"),
+    )
+
+
+def generate_weather(spark, months):
+    offset = col("id")
+    month_idx = pmod(offset, lit(12))
+    return spark.range(months).select(
+        concat((2015 + floor(offset / 12)).cast("string"), lit("-"),
+               lpad((month_idx + 1).cast("string"), 2, "0"), lit("-01 00:00:00")).alias("timestamp"),
+        round_(20 + 12 * sin(month_idx * 3.14159265 / 6), 2).alias("temperature"),
+        round_(60 + 20 * cos(month_idx * 3.14159265 / 6), 2).alias("humidity"),
+        round_(pmod(offset * 37, lit(100)) / 100.0, 2).alias("cloud_cover"),
+    )
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def read_spec(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def run_size(spark, rows, args, stages):
+    size_dir = os.path.join(args.work_dir, f"rows_{rows}")
+    data_dir = os.path.join(size_dir, "data")
+    power_csv = os.path.join(data_dir, "power_csv")
+    weather_csv = None if args.no_weather else os.path.join(data_dir, "weather_csv")
+    spec_path = os.path.join(data_dir, "spec.json")
+    spec = {"rows": rows, "history_months": args.history_months, "seed": args.seed, "weather": not args.no_weather}
+    cache_dir = os.path.join(size_dir, "cache")
+    # the cache and model outputs are timed, so every run starts without them
+    for scratch in (cache_dir, os.path.join(size_dir, "out")):
+        shutil.rmtree(scratch, ignore_errors=True)
+    record = {"rows": rows, "series": max(rows // args.history_months, 1), "history_months": args.history_months,
+              "seconds": {}}
+
+    def generate():
+        shutil.rmtree(data_dir, ignore_errors=True)
+        generate_power(spark, rows, args.history_months, args.seed).write.csv(power_csv, header=True)
+        if weather_csv:
+            generate_weather(spark, args.history_months).coalesce(1).write.csv(weather_csv, header=True)
+        with open(spec_path, "w") as fh:
+            json.dump(spec, fh)
+
+    if "generate" in stages:
+        record["seconds"]["generate"] = timed(generate)[0]
+    elif read_spec(spec_path) != spec:
+        # no usable data from an earlier run: write it, but leave it out of the timings
+        generate()
+
+    def load(cache):
+        power = forecasting_app.load_csv(spark, power_csv, cache_dir=cache)
+        weather = None
+        if weather_csv:
+            weather = forecasting_app.load_csv(spark, weather_csv, layout="weather", cache_dir=cache)
+        return power, weather
+
+    if "load" in stages:
+        record["seconds"]["load"] = timed(lambda: load(None)[0].write.format("noop").mode("overwrite").save())[0]
+    power_df, weather_df = load(None)
+    if "cache" in stages:
+        record["seconds"]["cache"], (power_df, weather_df) = timed(lambda: load(cache_dir))
+
+    features = forecasting_app.create_features(power_df, weather_df)
+    if "features" in stages:
+        record["seconds"]["features"] = timed(lambda: features.write.format("noop").mode("overwrite").save())[0]
+    if "train" in stages:
+        out_dir = os.path.join(size_dir, "out")
+        elapsed, (metrics, _, _) = timed(lambda: forecasting_app.train_and_evaluate(features, out_dir))
+        record["seconds"]["train"] = elapsed
+        record["metrics"] = metrics
+    return record
+
+
+def main():
+    args = parse_args()
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise SystemExit(f"Unknown stages: {unknown}")
+    sizes = [int(float(s)) for s in args.sizes.split(",") if s]
+
+    spark = SparkSession.builder.appName("PowerConsumptionForecastingBenchmark").getOrCreate()
+    report = {
+        "commit": git_commit(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        "spark_version": spark.version,
+        "default_parallelism": spark.sparkContext.defaultParallelism,
+        "weather": not args.no_weather,
+        "results": [],
+    }
+    for rows in sizes:
+        record = run_size(spark, rows, args, stages)
+        report["results"].append(record)
+        print(f"rows={rows}: " + ", ".join(f"{k}={v:.2f}s" for k, v in record["seconds"].items()))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print("Benchmark results written to", args.out)
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
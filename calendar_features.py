@@ -0,0 +1,163 @@
+"""Calendar and seasonal features.
+
+Which columns are produced depends on the spacing of the series
+(`--period`), so that none of them is constant. For the bundled monthly data
+the timestamp is always the first of the month at midnight, so `hour` and
+`day_of_week` carry nothing and are left out.
+
+- every period: `month`, annual Fourier terms `year_sin1`, `year_cos1`, ...
+  up to `fourier_order`, `days_in_month`, and the number of `working_days`,
+  weekday `holiday_days` and (unless the period is a whole number of weeks)
+  `weekend_days` in the period
+- periods shorter than a week: also `day_of_week` (1 = Sunday ... 7 = Saturday)
+- periods shorter than a day: also `hour` and daily Fourier terms
+- `season`: the CSV's Season column encoded as its 1-based position in
+  SEASONS (0 when unknown). Rows without a Season column, such as future
+  periods in forecast and stream mode, get the season of their month from
+  SEASON_BY_MONTH.
+
+Holidays are the fixed-date HOLIDAYS plus any dated ones from
+`--holidays-csv`. Spark computes every column with native expressions, the
+counts with higher-order functions over the days of the period, and adds
+them all in a single `select`. The pandas counterpart uses vectorized
+NumPy, with `busday_count` for the counts. No row-wise Python is involved.
+"""
+import csv
+import math
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import (array, col, coalesce, cos, create_map, date_sub, dayofmonth, dayofweek, dayofyear,
+                                   exists, expr, filter as filter_, greatest, hour, last_day, lit, lower, make_date,
+                                   minute, month, sequence, sin, size, to_date, trim, year)
+
+from weather_join import interval_offset, parse_duration
+
+FOURIER_ORDER = 2
+
+# fixed-date national holidays of the bundled data's region (India), as (month, day)
+HOLIDAYS = ((1, 26), (8, 15), (10, 2), (12, 25))
+
+SEASONS = ("winter", "summer_peak", "monsoon", "autumn")
+SEASON_CODES = {name: i for i, name in enumerate(SEASONS, start=1)}
+SEASON_BY_MONTH = {1: "winter", 2: "winter", 3: "autumn", 4: "summer_peak", 5: "summer_peak", 6: "monsoon",
+                   7: "monsoon", 8: "monsoon", 9: "autumn", 10: "autumn", 11: "winter", 12: "winter"}
+
+DAY_SECONDS = 86400
+
+
+def calendar_config(period="1 month", holidays=(), fourier_order=FOURIER_ORDER):
+    """Everything the calendar features depend on; `holidays` are extra dates ('YYYY-MM-DD')."""
+    parse_duration(period)
+    return {"period": period, "holidays": sorted(set(holidays)), "fourier_order": fourier_order}
+
+
+def load_holidays(path):
+    """Dates from the `date` column of a holidays CSV."""
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        rows = list(csv.DictReader(fh))
+    if rows and "date" not in rows[0]:
+        raise ValueError(f"Holidays CSV {path} needs a 'date' column")
+    return tuple(pd.to_datetime([r["date"] for r in rows]).strftime("%Y-%m-%d"))
+
+
+def calendar_feature_names(calendar=None):
+    calendar = calendar or calendar_config()
+    seconds = parse_duration(calendar["period"])
+    k = range(1, calendar["fourier_order"] + 1)
+    names = ["month", *[f"year_{f}{i}" for i in k for f in ("sin", "cos")]]
+    names += ["days_in_month", "working_days", "holiday_days"]
+    # every whole-week period has the same number of weekend days
+    if seconds % (7 * DAY_SECONDS):
+        names.append("weekend_days")
+    names.append("season")
+    if seconds < 7 * DAY_SECONDS:
+        names.append("day_of_week")
+    if seconds < DAY_SECONDS:
+        names += ["hour", *[f"day_{f}{i}" for i in k for f in ("sin", "cos")]]
+    return names
+
+
+def add_calendar_features(df, order_col="timestamp", calendar=None):
+    """Add the `calendar_feature_names(calendar)` columns in one select."""
+    calendar = calendar or calendar_config()
+    names = calendar_feature_names(calendar)
+    ts = col(order_col)
+
+    # the days of each period: [date, date of the next period), at least the row's own date
+    start = to_date(ts)
+    end = date_sub(to_date(ts + expr(f"INTERVAL {calendar['period']}")), 1)
+    days = sequence(start, greatest(start, end))
+    # a period spans at most two calendar years
+    holidays = [make_date(year(start) + y, lit(m), lit(d)) for y in (0, 1) for m, d in HOLIDAYS]
+    holidays += [to_date(lit(h)) for h in calendar["holidays"]]
+    holidays = array(*holidays)
+
+    def weekday(d):
+        return ~dayofweek(d).isin(1, 7)
+
+    def is_holiday(d):
+        return exists(holidays, lambda h: h == d)
+
+    year_angle = (dayofyear(ts) - 1 + hour(ts) / 24.0) * (2 * math.pi / 365.25)
+    day_angle = (hour(ts) * 60 + minute(ts)) * (2 * math.pi / 1440)
+    season_map = create_map(*[lit(x) for item in SEASON_CODES.items() for x in item])
+    month_season = create_map(*[lit(x) for m, name in SEASON_BY_MONTH.items() for x in (m, SEASON_CODES[name])])
+    season = season_map[trim(lower(col("Season")))] if "Season" in df.columns else month_season[month(ts)]
+
+    exprs = {
+        "month": month(ts),
+        "days_in_month": dayofmonth(last_day(ts)),
+        "working_days": size(filter_(days, lambda d: weekday(d) & ~is_holiday(d))),
+        "holiday_days": size(filter_(days, lambda d: weekday(d) & is_holiday(d))),
+        "weekend_days": size(filter_(days, lambda d: ~weekday(d))),
+        "season": coalesce(season, lit(0)),
+        "day_of_week": dayofweek(ts),
+        "hour": hour(ts),
+    }
+    for i in range(1, calendar["fourier_order"] + 1):
+        exprs.update({f"year_sin{i}": sin(year_angle * i), f"year_cos{i}": cos(year_angle * i),
+                      f"day_sin{i}": sin(day_angle * i), f"day_cos{i}": cos(day_angle * i)})
+    # replaces inputs of the same name, e.g. the CSV's Month (Spark resolves names case-insensitively)
+    kept = [c for c in df.columns if c.lower() not in set(names)]
+    return df.select(*kept, *[exprs[n].alias(n) for n in names])
+
+
+def add_calendar_features_pandas(pdf, order_col="timestamp", calendar=None):
+    """pandas counterpart of `add_calendar_features` producing the same columns and values."""
+    calendar = calendar or calendar_config()
+    names = calendar_feature_names(calendar)
+    ts = pdf[order_col]
+
+    start = ts.dt.normalize()
+    end = (ts + interval_offset(calendar["period"])).dt.normalize() - pd.Timedelta(days=1)
+    end = end.where(end > start, start)
+    begin, stop = start.to_numpy("datetime64[D]"), end.to_numpy("datetime64[D]") + 1
+    years = range(int(start.dt.year.min()), int(start.dt.year.max()) + 2) if len(pdf) else ()
+    holidays = [f"{y:04d}-{m:02d}-{d:02d}" for y in years for m, d in HOLIDAYS] + list(calendar["holidays"])
+    holidays = np.array(holidays, dtype="datetime64[D]")
+    weekdays = np.busday_count(begin, stop)
+    working = np.busday_count(begin, stop, holidays=holidays)
+
+    year_angle = (ts.dt.dayofyear - 1 + ts.dt.hour / 24.0) * (2 * math.pi / 365.25)
+    day_angle = (ts.dt.hour * 60 + ts.dt.minute) * (2 * math.pi / 1440)
+    if "Season" in pdf.columns:
+        season = pdf["Season"].astype("string").str.strip().str.lower().map(SEASON_CODES)
+    else:
+        season = ts.dt.month.map({m: SEASON_CODES[name] for m, name in SEASON_BY_MONTH.items()})
+
+    values = {
+        "month": ts.dt.month,
+        "days_in_month": ts.dt.days_in_month,
+        "working_days": working,
+        "holiday_days": weekdays - working,
+        "weekend_days": (stop - begin).astype(np.int64) - weekdays,
+        "season": season.fillna(0).astype(np.int64),
+        "day_of_week": (ts.dt.dayofweek + 1) % 7 + 1,
+        "hour": ts.dt.hour,
+    }
+    for i in range(1, calendar["fourier_order"] + 1):
+        values.update({f"year_sin{i}": np.sin(year_angle * i), f"year_cos{i}": np.cos(year_angle * i),
+                       f"day_sin{i}": np.sin(day_angle * i), f"day_cos{i}": np.cos(day_angle * i)})
+    pdf = pdf.drop(columns=[c for c in pdf.columns if c.lower() in set(names)])
+    return pdf.assign(**{n: np.asarray(values[n]) for n in names})
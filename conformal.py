@@ -0,0 +1,281 @@
+"""Prediction intervals by split-conformal calibration on h-step rollout residuals.
+
+No extra model is fitted. The holdout after the training cutoff is split in
+two. In its first half, the calibration slice, the trained model is rolled
+out recursively (see backtesting.rollout) from the cutoff and from every
+later period of the slice, so the residual of horizon h is a genuine h-step
+error: its lags come from the model's own earlier predictions. The
+absolute residuals |target - prediction| of all origins are the conformity
+scores. For a coverage level c and a segment with n scores, the band
+half-width is the ceil((n + 1) c)-th smallest score, so each band is
+`prediction -/+ q` and covers a new residual from the same segment with
+probability at least c. Coverage 0.8 gives P10/P90 bands, written as
+`lower_80` and `upper_80`.
+
+Scores are segmented by series and horizon, pooled across origins.
+`calibrate` counts the scores of every (series, horizon), horizon, series
+and global segment with one `cube`, then reads each segment's quantile from
+a second `cube` of `percentile_approx`, a mergeable sketch that is exact at
+these sizes. A segment with too few scores for a level, e.g. fewer than 4
+for 0.8, has no quantile for it. Its rows fall back to their horizon's
+segment, then their series', then the global one.
+
+The calibration is saved with the model version (`conformal.json`) and
+applied wherever the model predicts. Forecast mode uses the band of each
+recursive horizon; horizons beyond the calibrated ones use the largest.
+The holdout store, score mode and stream mode predict one period ahead
+from observed lags, so they get horizon-1 bands. Holdout rows in the
+calibration slice are marked `band_in_sample`, and the reported coverage
+only counts the rows after it.
+"""
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import (abs as abs_, array, broadcast, coalesce, col, count, greatest, grouping, least, lit, mean,
+                                   percentile_approx, when)
+from pyspark.sql.types import DoubleType, LongType, StructField, StructType
+
+DEFAULT_COVERAGES = (0.8,)
+CALIBRATION_FILE = "conformal.json"
+
+# keeps e.g. (4 + 1) * 0.8 from rounding up to rank 5
+_EPS = 1e-9
+
+# relative rank error of percentile_approx: exact below about this many scores per segment
+ACCURACY = 10000
+
+
+def parse_coverages(value):
+    """Parse a CLI value such as '0.8,0.95' (empty: no intervals)."""
+    coverages = tuple(sorted({float(v) for v in value.split(",") if v.strip()}))
+    bad = [c for c in coverages if not 0 < c < 1]
+    if bad:
+        raise ValueError(f"Coverage levels must be between 0 and 1, got {bad}")
+    return coverages
+
+
+def interval_columns(coverage):
+    """(lower, upper) column names of a coverage level, e.g. ('lower_80', 'upper_80') for 0.8."""
+    pct = f"{coverage * 100:g}".replace(".", "_")
+    return f"lower_{pct}", f"upper_{pct}"
+
+
+def calibration_origins(periods, cutoff):
+    """(rollout origins, last period) of the calibration slice, the first half of the periods after `cutoff`.
+
+    The origins are the cutoff and every slice period but the last; ([], None) when the slice is empty.
+    """
+    after = [p for p in periods if p > cutoff]
+    calibration = after[:len(after) // 2]
+    if not calibration:
+        return [], None
+    return [cutoff, *calibration[:-1]], calibration[-1]
+
+
+def _rank(n, coverage):
+    """1-based rank of the conformal quantile among n sorted scores, or None when n is too small."""
+    rank = math.ceil((n + 1) * coverage - _EPS)
+    return rank if rank <= n else None
+
+
+def _fallback(series_cols):
+    """Segment keys from finest to coarsest: (series, horizon), (horizon,), (series,), ()."""
+    coarser = [("horizon",), *((k,) for k in series_cols)] if series_cols else []
+    return [(*series_cols, "horizon"), *coarser, ()]
+
+
+def _calibration(segments, coverages, cutoff, until, origins):
+    horizon = next(s for s in segments if s["by"] == ["horizon"])
+    return {
+        "method": "split_conformal",
+        "score": "absolute_residual",
+        "coverages": list(coverages),
+        "cutoff": str(pd.Timestamp(cutoff)) if cutoff is not None else None,
+        "calibrated_through": str(pd.Timestamp(until)) if until is not None else None,
+        "origins": origins,
+        "max_horizon": max((r[0] for r in horizon["rows"]), default=1),
+        "residuals": segments[-1]["rows"][0][0] if segments[-1]["rows"] else 0,
+        "segments": segments,
+    }
+
+
+def calibrate(residuals, coverages=DEFAULT_COVERAGES, series_cols=(), cutoff=None, until=None, origins=None):
+    """Conformal quantiles per segment from rollout `residuals` (with `horizon`, `target`, `prediction`).
+
+    Two aggregations over the scores: a cube of counts, then a cube of `percentile_approx` at the ranks the counts
+    call for. Returns the calibration as a JSON-ready dict; each segment lists rows of [*keys, n, q per coverage].
+    """
+    keys = [*series_cols, "horizon"]
+    scored = residuals.where(col("prediction").isNotNull() & col("target").isNotNull())
+    scores = scored.select(*keys, abs_(col("target") - col("prediction")).alias("score"))
+    flags = [grouping(k).alias(f"_all_{k}") for k in keys]
+    counted = scores.cube(*keys).agg(*flags, count(lit(1)).alias("n")).collect()
+
+    def segment(r):
+        return tuple(r[f"_all_{k}"] for k in keys) + tuple(r[k] for k in keys)
+
+    # percentile_approx at (rank - 0.5) / n returns exactly the rank-th smallest score while the sketch is exact
+    levels = {}
+    for r in counted:
+        for c in coverages:
+            rank = _rank(r["n"], c)
+            if rank is not None:
+                levels[(segment(r), c)] = (rank - 0.5) / r["n"]
+    distinct = sorted(set(levels.values()))
+    quantiles = {}
+    if distinct:
+        sketch = percentile_approx("score", array(*[lit(p) for p in distinct]), ACCURACY).alias("_q")
+        for r in scores.cube(*keys).agg(*flags, sketch).collect():
+            quantiles[segment(r)] = dict(zip(distinct, r["_q"]))
+
+    segments = []
+    for by in _fallback(series_cols):
+        wanted = {k: int(k not in by) for k in keys}
+        members = [r for r in counted if all(r[f"_all_{k}"] == v for k, v in wanted.items())]
+        members.sort(key=lambda r: tuple(str(r[k]) for k in by))
+        rows = []
+        for r in members:
+            found = [levels.get((segment(r), c)) for c in coverages]
+            rows.append([*(r[k] for k in by), r["n"], *(None if p is None else quantiles[segment(r)][p] for p in found)])
+        segments.append({"by": list(by), "rows": rows})
+    return _calibration(segments, coverages, cutoff, until, origins)
+
+
+def calibrate_pandas(residuals, coverages=DEFAULT_COVERAGES, series_cols=(), cutoff=None, until=None, origins=None):
+    """pandas counterpart of `calibrate` (a sort per segment instead of the sketches)."""
+    keys = [*series_cols, "horizon"]
+    pdf = residuals.dropna(subset=["prediction", "target"])
+    scores = pdf[keys].assign(score=(pdf["target"].astype(np.float64) - pdf["prediction"]).abs(), _all=0)
+
+    segments = []
+    for by in _fallback(series_cols):
+        group = list(by) or ["_all"]
+        ordered = scores.sort_values([*group, "score"], kind="stable")
+        groups = ordered.groupby(group, sort=True)
+        rank = groups.cumcount() + 1
+        n = groups["score"].transform("size")
+        table = groups.size().rename("n").reset_index()
+        for i, c in enumerate(coverages):
+            target_rank = np.ceil((n + 1) * c - _EPS)
+            picked = ordered.loc[rank == target_rank, [*group, "score"]].rename(columns={"score": f"q{i}"})
+            table = table.merge(picked, on=group, how="left")
+        table = table[[*by, "n", *[f"q{i}" for i in range(len(coverages))]]]
+        rows = table.astype(object).where(table.notna(), None).values.tolist()
+        rows.sort(key=lambda r: tuple(str(v) for v in r[:len(by)]))
+        segments.append({"by": list(by), "rows": rows})
+    return _calibration(segments, coverages, cutoff, until, origins)
+
+
+def save_calibration(calibration, directory):
+    path = os.path.join(directory, CALIBRATION_FILE)
+    with open(path, "w") as fh:
+        json.dump(calibration, fh, indent=2, default=str)
+    return path
+
+
+def load_calibration(model_path):
+    """The calibration saved next to a model artifact, or None (the model then predicts without intervals)."""
+    path = os.path.join(os.path.dirname(os.path.normpath(model_path)), CALIBRATION_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _segment_rows(seg, n_coverages):
+    # JSON turns whole-number quantiles into ints; the table schema wants doubles
+    return [[*r[:len(seg["by"]) + 1], *(None if q is None else float(q) for q in r[-n_coverages:])] for r in seg["rows"]]
+
+
+def add_intervals(predictions, calibration):
+    """Add the lower/upper band columns of every calibrated coverage level to `predictions`.
+
+    Rows are banded for their `horizon`, or for horizon 1 (one period ahead) when there is no such column. Each
+    finer segment is a broadcast join; the global quantiles are literals.
+    """
+    coverages = calibration["coverages"]
+    spark = predictions.sparkSession
+    horizon = col("horizon") if "horizon" in predictions.columns else lit(1)
+    df = predictions.withColumn("_h", least(greatest(horizon, lit(1)), lit(calibration["max_horizon"])))
+    temp, levels = ["_h"], []
+    for s, seg in enumerate(calibration["segments"]):
+        by = ["_h" if k == "horizon" else k for k in seg["by"]]
+        if any(k not in df.columns for k in by):
+            continue
+        names = [f"_q{s}_{i}" for i in range(len(coverages))]
+        rows = _segment_rows(seg, len(coverages))
+        if not by:
+            values = rows[0][1:] if rows else [None] * len(coverages)
+            df = df.select("*", *[lit(v).cast("double").alias(n) for v, n in zip(values, names)])
+        else:
+            schema = StructType([*(StructField(k, df.schema[k].dataType) for k in by), StructField("_n", LongType()),
+                                 *(StructField(n, DoubleType()) for n in names)])
+            df = df.join(broadcast(spark.createDataFrame(rows, schema).drop("_n")), on=by, how="left")
+        temp += names
+        levels.append(names)
+
+    bands = []
+    for i, c in enumerate(coverages):
+        q = coalesce(*[col(names[i]) for names in levels])
+        lower, upper = interval_columns(c)
+        bands += [(col("prediction") - q).alias(lower), (col("prediction") + q).alias(upper)]
+    return df.select(*[c for c in df.columns if c not in temp], *bands)
+
+
+def add_intervals_pandas(pdf, calibration):
+    """pandas counterpart of `add_intervals`."""
+    coverages = calibration["coverages"]
+    horizon = pdf["horizon"] if "horizon" in pdf.columns else pd.Series(1, index=pdf.index)
+    df = pdf.assign(_h=horizon.clip(lower=1, upper=calibration["max_horizon"]).astype(np.int64))
+    q = np.full((len(df), len(coverages)), np.nan)
+    for seg in calibration["segments"]:
+        by = ["_h" if k == "horizon" else k for k in seg["by"]]
+        if any(k not in df.columns for k in by):
+            continue
+        names = [f"_q{i}" for i in range(len(coverages))]
+        table = pd.DataFrame(_segment_rows(seg, len(coverages)), columns=[*by, "_n", *names], dtype=object)
+        if not by:
+            values = table[names].to_numpy(dtype=np.float64)[0] if len(table) else np.full(len(coverages), np.nan)
+            found = np.broadcast_to(values, q.shape)
+        else:
+            table = table.astype({"_h": np.int64} if "_h" in by else {}).astype({n: np.float64 for n in names})
+            keyed = df[by].astype({k: table[k].dtype for k in by if k != "_h"})
+            found = keyed.merge(table, on=by, how="left")[names].to_numpy(dtype=np.float64)
+        q = np.where(np.isnan(q), found, q)
+
+    bands = {}
+    for i, c in enumerate(coverages):
+        lower, upper = interval_columns(c)
+        bands[lower] = pdf["prediction"].to_numpy() - q[:, i]
+        bands[upper] = pdf["prediction"].to_numpy() + q[:, i]
+    return pdf.assign(**bands)
+
+
+def coverage(predictions, calibration):
+    """Share of labeled rows inside each band, over the rows not marked `band_in_sample`, in one aggregation."""
+    rows = predictions.where(col("target").isNotNull())
+    if "band_in_sample" in predictions.columns:
+        rows = rows.where(~col("band_in_sample"))
+    exprs = []
+    for c in calibration["coverages"]:
+        lower, upper = interval_columns(c)
+        inside = (col("target") >= col(lower)) & (col("target") <= col(upper))
+        exprs.append(mean(when(inside, 1.0).otherwise(0.0)).alias(lower.replace("lower", "coverage")))
+    result = rows.agg(*exprs).first()
+    return {k: result[k] for k in result.asDict()}
+
+
+def coverage_pandas(pdf, calibration):
+    """pandas counterpart of `coverage`."""
+    rows = pdf[pdf["target"].notna()]
+    if "band_in_sample" in pdf.columns:
+        rows = rows[~rows["band_in_sample"].astype(bool)]
+    out = {}
+    for c in calibration["coverages"]:
+        lower, upper = interval_columns(c)
+        inside = (rows["target"] >= rows[lower]) & (rows["target"] <= rows[upper])
+        out[lower.replace("lower", "coverage")] = float(inside.mean()) if len(rows) else None
+    return out
@@ -0,0 +1,103 @@
+"""Regression metrics from one aggregation pass over materialized predictions.
+
+Predictions are grouped by series and reduced to a handful of sums per
+group (count, squared and absolute error, absolute percentage error, and the
+sums needed for the target's variance). Overall RMSE, MAE, MAPE and R² are
+rolled up from those sums on the driver, so the per-series breakdown and the
+totals cost a single Spark job.
+
+MAPE is in percent and skips rows whose target is 0. `evaluate_pandas`
+computes the same sums for the in-process engine.
+"""
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import abs as abs_, col, count, lit, sum as sum_, when
+
+SUMS = ("n", "sse", "sae", "sape", "n_ape", "sy", "syy")
+
+
+def error_sums(predictions, group_cols=()):
+    """Collect the per-group sums behind every metric (a single group when `group_cols` is empty)."""
+    err = col("prediction") - col("target")
+    nonzero = col("target") != 0
+    aggs = [
+        count(lit(1)).alias("n"),
+        sum_(err * err).alias("sse"),
+        sum_(abs_(err)).alias("sae"),
+        sum_(when(nonzero, abs_(err / col("target")))).alias("sape"),
+        sum_(when(nonzero, 1).otherwise(0)).alias("n_ape"),
+        sum_(col("target")).alias("sy"),
+        sum_(col("target") * col("target")).alias("syy"),
+    ]
+    scored = predictions.where(col("prediction").isNotNull() & col("target").isNotNull())
+    grouped = scored.groupBy(*group_cols) if group_cols else scored
+    return [r.asDict() for r in grouped.agg(*aggs).collect()]
+
+
+def error_sums_pandas(pdf, group_cols=()):
+    """pandas counterpart of `error_sums`."""
+    pdf = pdf.dropna(subset=["prediction", "target"])
+    target = pdf["target"].astype(np.float64)
+    err = pdf["prediction"] - target
+    nonzero = target != 0
+    parts = pd.DataFrame({
+        "n": np.ones(len(pdf), dtype=np.int64),
+        "sse": err * err,
+        "sae": err.abs(),
+        "sape": (err / target.where(nonzero)).abs().fillna(0.0),
+        "n_ape": nonzero.astype(np.int64),
+        "sy": target,
+        "syy": target * target,
+    }, index=pdf.index)
+    if not group_cols:
+        rows = [{k: parts[k].sum() for k in parts.columns}]
+    else:
+        rows = parts.groupby([pdf[c] for c in group_cols], sort=False).sum().reset_index().to_dict("records")
+    # plain Python numbers, so the sums serialize like the Spark ones
+    return [{k: v.item() if isinstance(v, np.generic) else v for k, v in r.items()} for r in rows]
+
+
+def summarize(sums):
+    """RMSE, MAE, MAPE (%) and R² from one row of sums (or None when there are no rows)."""
+    n = sums["n"]
+    if not n:
+        return {"rows": 0, "RMSE": None, "MAE": None, "MAPE": None, "R2": None}
+    sst = sums["syy"] - sums["sy"] * sums["sy"] / n
+    return {
+        "rows": n,
+        "RMSE": math.sqrt(sums["sse"] / n),
+        "MAE": sums["sae"] / n,
+        "MAPE": 100.0 * sums["sape"] / sums["n_ape"] if sums["n_ape"] else None,
+        "R2": 1.0 - sums["sse"] / sst if sst > 0 else None,
+    }
+
+
+def evaluate(predictions, series_cols=()):
+    """Return (overall metrics, per-series metrics) from one pass over `predictions`."""
+    return _rollup(error_sums(predictions, series_cols), series_cols)
+
+
+def evaluate_pandas(pdf, series_cols=()):
+    """pandas counterpart of `evaluate`."""
+    return _rollup(error_sums_pandas(pdf, series_cols), series_cols)
+
+
+def _rollup(rows, series_cols):
+    total = {k: sum(r[k] or 0 for r in rows) for k in SUMS}
+    if not series_cols:
+        return summarize(total), []
+    by_series = [{**{c: r[c] for c in series_cols}, **summarize(r)} for r in rows]
+    by_series.sort(key=lambda r: tuple(str(r[c]) for c in series_cols))
+    return summarize(total), by_series
+
+
+def write_metrics(overall, by_series, output_dir, name="evaluation_metrics.json"):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+    with open(path, "w") as fh:
+        json.dump({"overall": overall, "by_series": by_series}, fh, indent=2, default=str)
+    return path
@@ -0,0 +1,90 @@
+"""Per-series lag and rolling-window features.
+
+All lag and rolling expressions share one window specification partitioned by
+the series key and ordered by time, and they are added in a single `select`,
+so Spark plans one shuffle and one sort per series for the whole feature set
+instead of a single-partition window pass per feature.
+
+Rolling windows cover the `n` rows *before* the current one, so no feature
+ever sees the value it is used to predict.
+"""
+from pyspark.sql.functions import avg, col, lag, max as max_, min as min_, stddev_samp
+from pyspark.sql.window import Window
+
+DEFAULT_LAGS = (1, 2, 3, 12)
+DEFAULT_WINDOWS = (3, 12)
+DEFAULT_STATS = ("mean", "std", "min", "max")
+
+STATS = {
+    "mean": avg,
+    "std": stddev_samp,
+    "min": min_,
+    "max": max_,
+}
+
+
+def parse_int_list(value):
+    """Parse a CLI value such as '1,2,3,12' (an empty string gives an empty tuple)."""
+    return tuple(int(v) for v in value.split(",") if v.strip())
+
+
+def series_keys(df, series_col="Apartment_ID"):
+    """Series key columns present in `df` (empty for single-series inputs)."""
+    return [series_col] if series_col and series_col in df.columns else []
+
+
+def lag_name(n, value_col="power"):
+    return f"lag{n}_{value_col}"
+
+
+def rolling_name(n, stat, value_col="power"):
+    return f"roll{n}_{stat}_{value_col}"
+
+
+def feature_names(lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, stats=DEFAULT_STATS, value_col="power"):
+    names = [lag_name(n, value_col) for n in lags]
+    names += [rolling_name(n, s, value_col) for n in windows for s in stats]
+    return names
+
+
+def add_series_features(df, value_col="power", series_col="Apartment_ID", order_col="timestamp",
+                        lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, stats=DEFAULT_STATS):
+    """Add lag and rolling mean/std/min/max columns of `value_col` for every series in one pass."""
+    unknown = [s for s in stats if s not in STATS]
+    if unknown:
+        raise ValueError(f"Unknown rolling statistics: {unknown} (expected some of {sorted(STATS)})")
+    if any(n < 1 for n in tuple(lags) + tuple(windows)):
+        raise ValueError("lags and rolling windows must be positive")
+
+    w = Window.partitionBy(*series_keys(df, series_col)).orderBy(order_col)
+    exprs = [lag(value_col, n).over(w).alias(lag_name(n, value_col)) for n in lags]
+    for n in windows:
+        frame = w.rowsBetween(-n, -1)
+        exprs += [STATS[s](col(value_col)).over(frame).alias(rolling_name(n, s, value_col)) for s in stats]
+    return df.select("*", *exprs)
+
+
+def add_series_features_pandas(pdf, value_col="power", series_col="Apartment_ID", order_col="timestamp",
+                               lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, stats=DEFAULT_STATS):
+    """pandas counterpart of `add_series_features` producing the same columns and values.
+
+    Used where a Spark window is not available (stateful streaming, in-process scoring).
+    The result is sorted by series and time.
+    """
+    keys = [series_col] if series_col and series_col in pdf.columns else []
+    pdf = pdf.sort_values(keys + [order_col], kind="stable").reset_index(drop=True)
+    values = pdf.groupby(keys, sort=False)[value_col] if keys else pdf[value_col]
+    for n in lags:
+        pdf[lag_name(n, value_col)] = values.shift(n)
+    prev = values.shift(1)
+    for n in windows:
+        if keys:
+            rolling = prev.groupby([pdf[k] for k in keys], sort=False).rolling(n, min_periods=1)
+        else:
+            rolling = prev.rolling(n, min_periods=1)
+        for s in stats:
+            out = getattr(rolling, s)()
+            if keys:
+                out = out.reset_index(level=list(range(len(keys))), drop=True)
+            pdf[rolling_name(n, s, value_col)] = out
+    return pdf
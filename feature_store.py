@@ -0,0 +1,241 @@
+"""Persisted feature frames that are extended, not recomputed, when history grows.
+
+A store lives under `<root>/<store key>/`. The key is a hash of the power
+input's identity (its resolved path) and of everything that changes feature
+values (lags, windows, statistics, series column, weather content and join
+settings, calendar settings, FEATURE_VERSION), so GBT-only changes reuse the
+store as is while two inputs never share one. The input's content is not
+part of the key: it is tracked by the manifest, so the store of a growing
+file is extended rather than replaced. Feature rows are kept as Parquet in batches,
+`data/batch=N/<series>=<id>/`. `manifest.json` lists the committed batches
+together with the size and SHA-256 of every input file they were built
+from.
+
+On each run the power input is compared with the manifest:
+
+- unchanged: the stored features are read back, with no feature work
+- append-only: every known file still starts with the bytes that were
+  hashed, and the extra rows all come after their series' last stored
+  period. Features are computed only for the new rows, plus the last
+  `max(lags, windows)` stored observations of each series as lookback, and
+  written as a new batch.
+- anything else: the store is rebuilt from scratch.
+
+Batches are written before the manifest is replaced, so a crashed run
+leaves files that no manifest refers to, never half a store. Once there are
+more than MAX_BATCHES batches, the next append compacts them into one.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+from pyspark.sql.functions import col, desc, max as max_, row_number
+from pyspark.sql.types import StructType
+from pyspark.sql.window import Window
+
+from calendar_features import calendar_config
+from feature_engine import DEFAULT_STATS
+from ingestion import content_hash, input_files, normalize_power
+
+# bump when create_features changes the values it produces
+FEATURE_VERSION = 2
+
+MAX_BATCHES = 24
+
+
+def config_key(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+def input_identity(path):
+    """Resolved absolute form of an input file, directory or glob; stays the same while its content grows."""
+    return os.path.realpath(os.path.abspath(path))
+
+
+def feature_config(lags, windows, series_col="Apartment_ID", weather_path=None, weather_mode="nearest",
+                   weather_tolerance="0 seconds", weather_interval="1 month", calendar=None, drop_unlabeled=True):
+    """Everything the feature values depend on besides the power input itself."""
+    return {
+        "version": FEATURE_VERSION,
+        "lags": list(lags),
+        "windows": list(windows),
+        "stats": list(DEFAULT_STATS),
+        "series_col": series_col,
+        "weather": content_hash(weather_path) if weather_path else None,
+        "weather_join": [weather_mode, weather_tolerance, weather_interval] if weather_path else None,
+        "calendar": calendar or calendar_config(),
+        # score runs keep rows without a target, so they get a store of their own
+        "drop_unlabeled": drop_unlabeled,
+    }
+
+
+def file_fingerprints(path, known=None, chunk_size=1 << 20):
+    """{file name: {size, sha256}} for every input file.
+
+    For files in `known`, also records whether the file still starts with
+    the known content (`prefix_ok`). Both come from one read of the file.
+    """
+    out = {}
+    for f in input_files(path):
+        name = os.path.basename(f)
+        old = (known or {}).get(name)
+        h = hashlib.sha256()
+        prefix = None
+        read = 0
+        with open(f, "rb") as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                if old and prefix is None and read + len(chunk) >= old["size"]:
+                    cut = old["size"] - read
+                    h.update(chunk[:cut])
+                    prefix = h.hexdigest()
+                    h.update(chunk[cut:])
+                else:
+                    h.update(chunk)
+                read += len(chunk)
+        if old and prefix is None and read == old["size"]:
+            prefix = h.hexdigest()
+        out[name] = {"size": read, "sha256": h.hexdigest()}
+        if old:
+            out[name]["prefix_ok"] = prefix == old["sha256"]
+    return out
+
+
+def _change(manifest, files):
+    if manifest is None:
+        return "rebuild"
+    known = manifest["files"]
+    if any(name not in files or not files[name].get("prefix_ok") for name in known):
+        return "rebuild"
+    if all(files[name]["sha256"] == known[name]["sha256"] for name in known) and set(files) == set(known):
+        return "unchanged"
+    return "append"
+
+
+class FeatureStore:
+    def __init__(self, spark, root, config, power_path):
+        self.spark = spark
+        self.config = config
+        self.power_path = power_path
+        self.series_col = config["series_col"]
+        self.path = os.path.join(root, config_key({**config, "input": input_identity(power_path)}))
+        self.data_path = os.path.join(self.path, "data")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as fh:
+            manifest = json.load(fh)
+        # a manifest whose batches were removed is as good as none
+        if not all(os.path.isdir(self._batch_path(b)) for b in manifest["batches"]):
+            return None
+        return manifest
+
+    def _batch_path(self, batch):
+        return os.path.join(self.data_path, f"batch={batch}")
+
+    def _commit(self, manifest):
+        tmp = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmp, self.manifest_path)
+        # drop batches (and leftovers of crashed runs) that the manifest no longer lists
+        live = {f"batch={b}" for b in manifest["batches"]}
+        for d in os.listdir(self.data_path):
+            if d not in live:
+                shutil.rmtree(os.path.join(self.data_path, d), ignore_errors=True)
+
+    def read(self, manifest):
+        schema = StructType.fromJson(manifest["schema"])
+        reader = self.spark.read.option("basePath", self.data_path).schema(schema)
+        df = reader.parquet(*[self._batch_path(b) for b in manifest["batches"]])
+        return df.select(*manifest["columns"])
+
+    def _write_batch(self, df, batch):
+        keys = [self.series_col] if self.series_col in df.columns else []
+        writer = df.write.mode("overwrite")
+        if keys:
+            writer = writer.partitionBy(*keys)
+        writer.parquet(self._batch_path(batch))
+
+    def load(self, power_df, build):
+        """Return (features, action) for `power_df`, read from the store's `power_path`; `build(raw)` runs create_features.
+
+        `action` is 'unchanged', 'append' or 'rebuild'.
+        """
+        manifest = self.manifest()
+        files = file_fingerprints(self.power_path, manifest["files"] if manifest else None)
+        action = _change(manifest, files)
+        files = {name: {"size": f["size"], "sha256": f["sha256"]} for name, f in files.items()}
+
+        if action == "unchanged":
+            return self.read(manifest), action
+
+        if action == "append":
+            new_features = self._increment(manifest, power_df, build)
+            if new_features is None:
+                action = "rebuild"
+            else:
+                batch = max(manifest["batches"]) + 1
+                self._write_batch(new_features, batch)
+                batches = manifest["batches"] + [batch]
+                manifest = {**manifest, "files": files, "batches": batches}
+                if len(batches) > MAX_BATCHES:
+                    # compact: one batch holding everything, committed like any other
+                    compacted = batch + 1
+                    self._write_batch(self.read(manifest), compacted)
+                    manifest["batches"] = [compacted]
+                self._commit(manifest)
+                return self.read(manifest), action
+
+        features = build(power_df)
+        os.makedirs(self.data_path, exist_ok=True)
+        batch = (max(manifest["batches"]) + 1) if manifest else 0
+        self._write_batch(features, batch)
+        self._commit({
+            "config": self.config,
+            "input": input_identity(self.power_path),
+            "files": files,
+            "batches": [batch],
+            "columns": features.columns,
+            "schema": features.schema.jsonValue(),
+        })
+        return self.read(self.manifest()), action
+
+    def _increment(self, manifest, power_df, build):
+        """Features of the rows after each series' last stored period, or None when the change is not a pure append."""
+        stored = self.read(manifest)
+        keys = [self.series_col] if self.series_col in stored.columns else []
+        depth = max(self.config["lags"] + self.config["windows"])
+        raw = normalize_power(power_df)
+        if self.config.get("drop_unlabeled", True):
+            raw = raw.where(col("power").isNotNull())
+
+        last = stored.groupBy(*keys).agg(max_("timestamp").alias("_last"))
+        if keys:
+            candidates = raw.join(last, on=keys, how="left")
+        else:
+            candidates = raw.crossJoin(last)
+        new = candidates.where(col("_last").isNull() | (col("timestamp") > col("_last")))
+
+        # a pure append adds exactly the rows that come after the stored history
+        if raw.count() - stored.count() != new.count():
+            return None
+
+        lookback = (stored
+                    .withColumn("_rn", row_number().over(Window.partitionBy(*keys).orderBy(desc("timestamp"))))
+                    .where(col("_rn") <= depth)
+                    .select(*keys, "timestamp", col("target").alias("power")))
+        # categorical inputs such as Season are kept for the new rows; lookback rows are dropped below
+        extra = [c for c in ("Season",) if c in new.columns]
+        features = build(lookback.unionByName(new.select(*keys, "timestamp", "power", *extra), allowMissingColumns=True))
+        # lookback rows were only there for the lags and rolling windows
+        cutoff = last.withColumnRenamed("_last", "_cutoff")
+        if keys:
+            features = features.join(cutoff, on=keys, how="left")
+        else:
+            features = features.crossJoin(cutoff)
+        features = features.where(col("_cutoff").isNull() | (col("timestamp") > col("_cutoff")))
+        return features.select(*manifest["columns"])
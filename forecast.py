@@ -0,0 +1,112 @@
+"""Multi-horizon forecasts by batched recursive rollout.
+
+Starting from the last `max(lags, windows)` observations of every series,
+each step appends one placeholder period per series, builds its lag/rolling
+and calendar features with the same code as training, and scores all series
+with a single `model.transform`. The predictions are fed back as the newest
+observations for the next step, so an N-step outlook costs N Spark jobs no
+matter how many series there are. Each step is locally checkpointed to keep
+the plan from growing with the horizon.
+
+Model inputs that the rollout cannot build, such as weather, can be passed
+as `exogenous` values by series and timestamp. Backtests use this to score
+h-step forecasts against the weather that was actually observed.
+
+`recursive_forecast_pandas` is the in-process counterpart for the local
+engine's scikit-learn models.
+"""
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import col, desc, expr, lit, max as max_, row_number
+from pyspark.sql.window import Window
+
+from calendar_features import add_calendar_features, add_calendar_features_pandas, calendar_feature_names
+from feature_engine import DEFAULT_LAGS, DEFAULT_WINDOWS, add_series_features, add_series_features_pandas, feature_names
+from scoring import model_features
+from weather_join import interval_offset
+
+
+def _latest(history, series_col, depth):
+    w = Window.partitionBy(series_col).orderBy(desc("timestamp"))
+    return history.withColumn("_rn", row_number().over(w)).where(col("_rn") <= depth).drop("_rn")
+
+
+def _unknown_inputs(features, names, calendar, known):
+    missing = [c for c in features if c not in set(names) | set(calendar_feature_names(calendar)) | set(known)]
+    if missing:
+        raise ValueError(f"Future values of model inputs {missing} are unknown; "
+                         "forecast with a model trained without weather and with the same --lags/--windows")
+
+
+def recursive_forecast(history, model, steps, series_col="Apartment_ID", lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                       period="1 month", calendar=None, exogenous=None):
+    """Return a frame of (series, horizon, timestamp, prediction) for `steps` periods after each series' last reading.
+
+    `history` holds observed rows with `timestamp` and `power` (and the series column, if any). `exogenous` holds
+    the other model inputs of the forecast periods, keyed by `timestamp` (and the series column, if any).
+    """
+    names = feature_names(lags, windows)
+    known = [] if exogenous is None else [c for c in exogenous.columns if c not in (series_col, "timestamp")]
+    _unknown_inputs(model_features(model), names, calendar, known)
+
+    if series_col not in history.columns:
+        history = history.withColumn(series_col, lit("all"))
+    depth = max(tuple(lags) + tuple(windows))
+    hist = _latest(history.select(series_col, "timestamp", "power").na.drop(), series_col, depth).localCheckpoint()
+
+    outputs = []
+    for h in range(1, steps + 1):
+        upcoming = (hist.groupBy(series_col).agg(max_("timestamp").alias("timestamp"))
+                    .withColumn("timestamp", expr(f"timestamp + INTERVAL {period}"))
+                    .withColumn("power", lit(None).cast("double")))
+        frame = hist.withColumn("_upcoming", lit(False)).unionByName(upcoming.withColumn("_upcoming", lit(True)))
+        feats = add_series_features(frame, series_col=series_col, lags=lags, windows=windows).where(col("_upcoming"))
+        feats = add_calendar_features(feats, calendar=calendar)
+        if exogenous is not None:
+            feats = feats.join(exogenous, on=[c for c in (series_col, "timestamp") if c in exogenous.columns], how="left")
+        feats = feats.fillna(0, subset=names + known)
+        preds = (model.transform(feats)
+                 .select(series_col, lit(h).alias("horizon"), "timestamp", "prediction")
+                 .localCheckpoint())
+        outputs.append(preds)
+        hist = _latest(hist.unionByName(preds.select(series_col, "timestamp", col("prediction").alias("power"))),
+                       series_col, depth).localCheckpoint()
+    return reduce(lambda a, b: a.unionByName(b), outputs)
+
+
+def recursive_forecast_pandas(history, model, features, steps, series_col="Apartment_ID", lags=DEFAULT_LAGS,
+                              windows=DEFAULT_WINDOWS, period="1 month", calendar=None, exogenous=None):
+    """pandas counterpart of `recursive_forecast` for a scikit-learn `model` fitted on the columns `features`."""
+    names = feature_names(lags, windows)
+    known = [] if exogenous is None else [c for c in exogenous.columns if c not in (series_col, "timestamp")]
+    _unknown_inputs(features, names, calendar, known)
+
+    if series_col not in history.columns:
+        history = history.assign(**{series_col: "all"})
+    depth = max(tuple(lags) + tuple(windows))
+    step = interval_offset(period)
+
+    def latest(frame):
+        return frame.sort_values([series_col, "timestamp"], kind="stable").groupby(series_col).tail(depth)
+
+    hist = latest(history[[series_col, "timestamp", "power"]].dropna())
+    outputs = []
+    for h in range(1, steps + 1):
+        upcoming = hist.groupby(series_col, as_index=False)["timestamp"].max()
+        upcoming["timestamp"] = upcoming["timestamp"] + step
+        upcoming["power"] = np.nan
+        frame = pd.concat([hist.assign(_upcoming=False), upcoming.assign(_upcoming=True)], ignore_index=True)
+        feats = add_series_features_pandas(frame, series_col=series_col, lags=lags, windows=windows)
+        feats = add_calendar_features_pandas(feats[feats["_upcoming"]].reset_index(drop=True), calendar=calendar)
+        if exogenous is not None:
+            feats = feats.merge(exogenous, on=[c for c in (series_col, "timestamp") if c in exogenous.columns],
+                                how="left")
+        feats = feats.fillna({c: 0 for c in names + known})
+        preds = feats[[series_col, "timestamp"]].assign(
+            horizon=h, prediction=model.predict(feats[features].to_numpy(dtype=np.float64)))
+        outputs.append(preds[[series_col, "horizon", "timestamp", "prediction"]])
+        hist = latest(pd.concat([hist, preds[[series_col, "timestamp"]].assign(power=preds["prediction"])],
+                                ignore_index=True))
+    return pd.concat(outputs, ignore_index=True)
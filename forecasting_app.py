@@ -14,175 +14,506 @@ press Enter (so you can inspect http://localhost:4040).
 import argparse
 import os
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, hour, dayofweek, month, to_timestamp, trim, lower, concat, lit, when
-from pyspark.sql.window import Window
-from pyspark.sql.functions import lag
+from pyspark.sql.functions import col, lit, max as max_
 from pyspark.ml.feature import VectorAssembler
 from pyspark.ml.regression import GBTRegressor
 from pyspark.ml import Pipeline
-from pyspark.ml.evaluation import RegressionEvaluator
+
+from backtesting import FOLD_TYPES, distinct_periods, rollout, run_backtest, split_cutoff, time_split, write_report
+from calendar_features import FOURIER_ORDER, add_calendar_features, calendar_config, calendar_feature_names, load_holidays
+from conformal import (DEFAULT_COVERAGES, add_intervals, calibrate, calibration_origins, coverage, load_calibration,
+                       parse_coverages, save_calibration)
+from evaluation import evaluate, write_metrics
+from feature_store import FeatureStore, feature_config
+from feature_engine import DEFAULT_LAGS, DEFAULT_WINDOWS, add_series_features, feature_names, parse_int_list, series_keys
+from forecast import recursive_forecast
+from gbt_export import export_gbt
+from hierarchy import (METHODS, attach_levels, leaf_membership, level_metrics, mint_variance, node_series,
+                       parse_levels, reconcile_predictions, scale_series, shrink_covariance, summing_matrix, unscale, wide,
+                       write_hierarchy_metrics)
+from ingestion import data_version, load_power, load_weather, normalize_power, normalize_weather, read_csv_pandas
+from instrumentation import RunReport, stage
+from local_engine import ENGINES, LOCAL_MAX_BYTES, create_features_pandas, select_engine, train_and_evaluate_local
+from model_registry import ModelRegistry, resolve_model_path
+from per_series import train_per_series
+from prediction_store import write_store
+from retraining import DRIFT_PERIODS, DRIFT_THRESHOLD, GATE_PERIODS, retrain
+from scoring import load_model, score
+from streaming import stream_forecasts
+from tuning import SEARCH_MODES, tune
+from weather_join import JOIN_MODES, asof_join, fill_weather_gaps
 
 
 def parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument("--power-csv", required=True, help="Power usage CSV with timestamp and power columns")
+    p.add_argument("--mode", choices=("train", "backtest", "tune", "score", "stream", "forecast", "retrain", "rollback",
+                                       "hierarchy"),
+                   default="train",
+                   help="train: fit on history and save the model; backtest: rolling-origin evaluation; "
+                        "tune: GBT parameter search; score: predict with a saved model without retraining; "
+                        "stream: forecast incrementally from CSVs dropped into --landing-dir; "
+                        "forecast: predict the next --steps periods of every series; "
+                        "retrain: refit only if the data changed and residuals drifted; "
+                        "rollback: make an earlier model version current; "
+                        "hierarchy: forecast every apartment/building/grid level and reconcile them")
+    p.add_argument("--power-csv", help="Power usage CSV (or Parquet) with timestamp and power columns; "
+                                        "in stream mode, the history that seeds each series' lags")
     p.add_argument("--weather-csv", required=False, help="Weather CSV with timestamp and temp/humidity/cloud columns")
     p.add_argument("--output-dir", default="outputs/forecasts", help="Directory to write predictions and model")
     p.add_argument("--keep-ui", action="store_true", help="Keep Spark UI running until Enter pressed")
     p.add_argument("--model-name", default="gbt_model", help="Name for saved model directory")
-    return p.parse_args()
-
-
-def load_csv(spark, path, schema_infer=True):
-    return spark.read.csv(path, header=True, inferSchema=schema_infer)
-
-
-def create_features(df_power, df_weather=None):
-    # Ensure timestamp column exists and is of timestamp type
-    if "timestamp" in df_power.columns:
-        df = df_power.withColumn("timestamp", to_timestamp(col("timestamp")))
-    elif "Year" in df_power.columns and "Month" in df_power.columns:
-        # normalize Month into numeric (accept names like 'Jan' or numbers)
-        month_col = trim(lower(col("Month")))
-        month_map = {
-            'jan': 1, 'january': 1,
-            'feb': 2, 'february': 2,
-            'mar': 3, 'march': 3,
-            'apr': 4, 'april': 4,
-            'may': 5,
-            'jun': 6, 'june': 6,
-            'jul': 7, 'july': 7,
-            'aug': 8, 'august': 8,
-            'sep': 9, 'sept': 9, 'september': 9,
-            'oct': 10, 'october': 10,
-            'nov': 11, 'november': 11,
-            'dec': 12, 'december': 12
-        }
-        m = month_col
-        month_expr = None
-        for name, idx in month_map.items():
-            if month_expr is None:
-                month_expr = when(m == name, idx)
-            else:
-                month_expr = month_expr.when(m == name, idx)
-        month_expr = month_expr.otherwise(when(col("Month").cast("int").isNotNull(), col("Month").cast("int")).otherwise(None))
-        df = df_power.withColumn("Month", month_expr)
-        df = df.withColumn("Year", col("Year").cast("int"))
-        # create synthetic timestamp from Year-Month-01
-        df = df.withColumn("timestamp", to_timestamp(concat(col("Year"), lit("-"), col("Month"), lit("-01")), "yyyy-M-d"))
-    else:
-        raise ValueError("power CSV must contain a 'timestamp' column or 'Year' and 'Month' columns")
-
-    # rename power column if needed
-    power_candidates = [c for c in df.columns if c.lower() in ("power", "power_draw", "mw", "value", "usage", "power_usage")]
-    if power_candidates:
-        power_col = power_candidates[0]
-        df = df.withColumnRenamed(power_col, "power")
-    elif "Monthly_kWh" in df.columns:
-        df = df.withColumnRenamed("Monthly_kWh", "power")
-    else:
-        raise ValueError("power CSV must contain a numeric power column (e.g. 'power' or 'Monthly_kWh')")
+    p.add_argument("--model-path", help="Saved PipelineModel or local-engine model.pkl to score with "
+                                        "(default: current version of <model-name>)")
+    p.add_argument("--weather-join", choices=JOIN_MODES, default="nearest",
+                   help="nearest: closest reading within --weather-tolerance; last: latest reading at or before the period; "
+                        "mean: average of readings within --weather-interval")
+    p.add_argument("--weather-tolerance", default="0 seconds", help="Max distance for nearest/last weather matches, e.g. '1 hour'")
+    p.add_argument("--weather-interval", default="1 month", help="Length of a power period for --weather-join mean")
+    p.add_argument("--lags", type=parse_int_list, default=DEFAULT_LAGS, help="Comma-separated lags (in periods) of the power series, e.g. 1,2,3,12")
+    p.add_argument("--windows", type=parse_int_list, default=DEFAULT_WINDOWS, help="Comma-separated rolling window sizes for mean/std/min/max features")
+    p.add_argument("--folds", type=int, default=3, help="Number of backtest folds")
+    p.add_argument("--horizon", type=int, default=3, help="Periods scored after each backtest cutoff")
+    p.add_argument("--fold-type", choices=FOLD_TYPES, default="expanding", help="Expanding or sliding training window for backtest folds")
+    p.add_argument("--train-periods", type=int, help="Training window length (in periods) for sliding folds")
+    p.add_argument("--parallelism", type=int, help="Concurrent Spark fits (default: one per fold / per core when tuning)")
+    p.add_argument("--search", choices=SEARCH_MODES, default="grid", help="Tuning search: full grid or a random sample of it")
+    p.add_argument("--samples", type=int, default=10, help="Candidates drawn for --search random")
+    p.add_argument("--steps", type=int, default=12, help="Periods ahead to forecast in forecast mode, and the longest horizon train calibrates intervals for")
+    p.add_argument("--period", default="1 month",
+                   help="Spacing of the power series, as a Spark interval; selects the calendar features and the forecast step")
+    p.add_argument("--holidays-csv", help="CSV with a 'date' column of holidays, in addition to the fixed-date national ones")
+    p.add_argument("--fourier-order", type=int, default=FOURIER_ORDER, help="Sine/cosine pairs of the annual (and daily) seasonal terms")
+    p.add_argument("--landing-dir", help="Directory watched for new power CSVs in stream mode")
+    p.add_argument("--checkpoint-dir", help="Streaming checkpoint directory (default: <output-dir>/_stream_checkpoint)")
+    p.add_argument("--trigger-seconds", type=int, default=60, help="Streaming micro-batch interval")
+    p.add_argument("--once", action="store_true", help="Process the files already landed, then stop (stream mode)")
+    p.add_argument("--per-series", action="store_true",
+                   help="Train one scikit-learn GBT per --group-col value on the executors instead of one global Spark GBT")
+    p.add_argument("--group-col", default="Apartment_ID", help="Column whose values get their own model with --per-series")
+    p.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD,
+                   help="Retrain a series when its recent MAE exceeds its holdout MAE by this fraction")
+    p.add_argument("--drift-periods", type=int, default=DRIFT_PERIODS, help="Periods checked for drift when no new periods arrived")
+    p.add_argument("--gate-periods", type=int, default=GATE_PERIODS,
+                   help="Fewest unseen periods to compare a retrain candidate with the current model on; fewer skip the gate")
+    p.add_argument("--force-retrain", action="store_true", help="Retrain (all series) even without new data or drift")
+    p.add_argument("--version", type=int, help="Model version to make current in rollback mode (default: the previous one)")
+    p.add_argument("--hierarchy-levels", type=parse_levels, default=(),
+                   help="Comma-separated level columns above --group-col, e.g. Building_ID,Feeder_ID (a grid total is always added)")
+    p.add_argument("--hierarchy-map", help="CSV mapping each --group-col value to its --hierarchy-levels (for levels not in the power data)")
+    p.add_argument("--reconcile", choices=METHODS, default="mint", help="Reconciliation method in hierarchy mode")
+    p.add_argument("--interval-coverage", type=parse_coverages, default=DEFAULT_COVERAGES,
+                   help="Comma-separated coverage levels of the split-conformal prediction intervals calibrated on the "
+                        "holdout residuals, e.g. 0.8 (P10/P90) or 0.8,0.95; empty for point predictions only")
+    p.add_argument("--export-scorer", action="store_true", help="Also export the trained model as model.npz in its version directory, for the JVM-free NumPy scorer")
+    p.add_argument("--cache-dir", default="outputs/cache", help="Directory for the content-hashed Parquet cache of parsed inputs")
+    p.add_argument("--no-cache", action="store_true", help="Always parse the input CSVs, bypassing the Parquet cache")
+    p.add_argument("--no-feature-store", action="store_true",
+                   help="Recompute all features instead of reusing/extending the feature store under <cache-dir>/features")
+    p.add_argument("--engine", choices=ENGINES, default="auto",
+                   help="spark, local (pandas/scikit-learn in-process, train mode only) or auto: local for inputs up to --local-max-mb")
+    p.add_argument("--local-max-mb", type=float, default=LOCAL_MAX_BYTES / 2**20, help="Largest input (MB) run in-process under --engine auto")
+    p.add_argument("--report-path", help="JSON run report with per-stage timings and Spark metrics (default: <output-dir>/run_report.json)")
+    p.add_argument("--prometheus-file", help="Also write the run report as Prometheus gauges to this file")
+    args = p.parse_args()
+    if args.mode == "stream" and not args.landing_dir:
+        p.error("--landing-dir is required in stream mode")
+    if args.mode not in ("stream", "rollback") and not args.power_csv:
+        p.error("--power-csv is required")
+    if args.engine == "local" and not local_supported(args):
+        p.error("--engine local supports --mode train without --per-series or --export-scorer")
+    try:
+        args.calendar = calendar_config(args.period, load_holidays(args.holidays_csv) if args.holidays_csv else (),
+                                        args.fourier_order)
+    except ValueError as e:
+        p.error(str(e))
+    return args
+
+
+def local_supported(args):
+    return args.mode == "train" and not args.per_series and not args.export_scorer
+
 
-    # temporal features
-    df = df.withColumn("hour", hour(col("timestamp")))
-    df = df.withColumn("day_of_week", dayofweek(col("timestamp")))
-    df = df.withColumn("month", month(col("timestamp")))
+def load_csv(spark, path, layout="power", cache_dir=None):
+    # schema-declared single-pass read; see ingestion.py
+    if layout == "weather":
+        return load_weather(spark, path, cache_dir=cache_dir)
+    return load_power(spark, path, cache_dir=cache_dir)
 
-    # lagged feature (previous period's power). Order by timestamp
-    w = Window.orderBy("timestamp")
-    df = df.withColumn("lag1_power", lag("power", 1).over(w))
 
-    # join weather if provided (exact timestamp join)
+def create_features(df_power, df_weather=None, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, series_col="Apartment_ID",
+                    weather_mode="nearest", weather_tolerance="0 seconds", weather_interval="1 month", calendar=None,
+                    drop_unlabeled=True):
+    # canonical timestamp/power columns (no-op for frames that come from the ingestion layer)
+    df = normalize_power(df_power)
+    # training needs a target; scoring keeps unlabeled rows and writes their target as null
+    if drop_unlabeled:
+        df = df.na.drop(subset=["power"])
+
+    # calendar and seasonal features for the series' spacing, in one select (see calendar_features.py)
+    df = add_calendar_features(df, calendar=calendar)
+
+    # lagged and rolling features, computed per series in one window pass (see feature_engine.py)
+    df = add_series_features(df, series_col=series_col, lags=lags, windows=windows)
+
+    # join weather if provided (broadcast as-of join, see weather_join.py); gaps get the weather mean, not 0
     if df_weather is not None:
-        if "timestamp" in df_weather.columns:
-            df_weather = df_weather.withColumn("timestamp", to_timestamp(col("timestamp")))
-        # attempt to normalize common weather column names
-        weather_cols = {}
-        for c in df_weather.columns:
-            lc = c.lower()
-            if "temp" in lc:
-                weather_cols[c] = "temperature"
-            if "humid" in lc:
-                weather_cols[c] = "humidity"
-            if "cloud" in lc or "cover" in lc:
-                weather_cols[c] = "cloud_cover"
-        for orig, new in weather_cols.items():
-            df_weather = df_weather.withColumnRenamed(orig, new)
-        df = df.join(df_weather.select("timestamp", *[c for c in df_weather.columns if c != "timestamp"]), on="timestamp", how="left")
+        df_weather = normalize_weather(df_weather)
+        df = asof_join(df, df_weather, mode=weather_mode, tolerance=weather_tolerance, interval=weather_interval)
+        df = fill_weather_gaps(df, df_weather)
 
     # keep only relevant numeric columns and drop nulls
-    candidate_features = ["hour", "day_of_week", "month", "lag1_power", "temperature", "humidity", "cloud_cover"]
+    candidate_features = [*calendar_feature_names(calendar), *feature_names(lags, windows), "temperature", "humidity", "cloud_cover"]
     available = [c for c in candidate_features if c in df.columns]
-    df = df.select("timestamp", "power", *available)
-    df = df.na.drop(subset=["power"])
+    df = df.select(*series_keys(df, series_col), "timestamp", "power", *available)
     # fill missing feature values (simple) with 0 or mean could be used; here use 0
-    df = df.fillna(0)
+    df = df.fillna(0, subset=available)
     # rename target
     df = df.withColumnRenamed("power", "target")
+    # one partition per core keeps each GBT iteration from scheduling hundreds of tiny tasks. A repartition, not a
+    # coalesce: the shuffle boundary leaves the per-series window stage at spark.sql.shuffle.partitions tasks
+    df = df.repartition(df.sparkSession.sparkContext.defaultParallelism)
     return df
 
 
-def train_and_evaluate(df, output_dir, model_name="gbt_model"):
-    # split
-    train, test = df.randomSplit([0.8, 0.2], seed=42)
-
+def feature_columns(df):
     # select numeric feature columns
-    numeric = [name for name, dtype in train.dtypes if name != "target" and dtype in ("int", "bigint", "double", "float")]
+    numeric = [name for name, dtype in df.dtypes if name != "target" and dtype in ("int", "bigint", "double", "float")]
     if not numeric:
         raise RuntimeError("No numeric features available for training")
+    return numeric
+
 
-    assembler = VectorAssembler(inputCols=numeric, outputCol="features")
+def build_pipeline(features):
+    assembler = VectorAssembler(inputCols=features, outputCol="features")
     gbt = GBTRegressor(featuresCol="features", labelCol="target", maxIter=50)
-    pipeline = Pipeline(stages=[assembler, gbt])
+    return Pipeline(stages=[assembler, gbt])
+
+
+def train_and_evaluate(df, output_dir, model_name="gbt_model", report=None, data=None, promote=True,
+                       coverages=DEFAULT_COVERAGES, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, period="1 month",
+                       calendar=None, max_horizon=12):
+    # time-ordered split: the last 20% of periods are held out
+    periods = distinct_periods(df)
+    cutoff = split_cutoff(periods, test_fraction=0.2)
+    train, test = df.where(col("timestamp") <= lit(cutoff)), df.where(col("timestamp") > lit(cutoff))
+
+    pipeline = build_pipeline(feature_columns(df))
+    with stage(report, "fit") as st:
+        st["rows_in"] = train.count()
+        model = pipeline.fit(train)
+    keys = series_keys(df)
+
+    calibration = None
+    origins, until = calibration_origins(periods, cutoff)
+    if coverages and origins:
+        with stage(report, "calibrate") as st:
+            # split-conformal bands from h-step rollouts over the first half of the holdout, no extra fits
+            # (see conformal.py)
+            residuals = rollout(df, model, origins, min(len(origins), max_horizon), feature_columns(df), lags=lags,
+                                windows=windows, period=period, calendar=calendar, until=until, periods=periods).persist()
+            calibration = calibrate(residuals, coverages, keys, cutoff, until, len(origins))
+            residuals.unpersist()
+            st["rows_in"] = calibration["residuals"]
+
+    predictions = model.transform(test).select(*keys, "timestamp", "target", "prediction")
+    if calibration is not None:
+        # the rows the bands were calibrated on are kept but marked, and left out of the reported coverage
+        predictions = add_intervals(predictions.withColumn("band_in_sample", col("timestamp") <= lit(until)),
+                                    calibration)
+
+    # every output goes into the new version's directory; the registry copies them to output_dir only if the
+    # version becomes current, so a rejected retrain candidate leaves the served outputs alone
+    versions = ModelRegistry.for_model(output_dir, model_name)
+    with versions.staging() as staging:
+        with stage(report, "write") as st:
+            # predictions are computed once, by the store write; every later output reads the store
+            store_path = os.path.join(staging, "predictions.parquet")
+            write_store(predictions, store_path)
+            predictions = df.sparkSession.read.schema(predictions.schema).parquet(store_path)
+
+            # also write CSV sample
+            sample_csv = os.path.join(staging, "predictions_sample.csv")
+            predictions.limit(500).toPandas().to_csv(sample_csv, index=False)
+
+        with stage(report, "evaluate") as st:
+            # overall and per-series metrics in one aggregation
+            metrics, by_series = evaluate(predictions, keys)
+            if calibration is not None:
+                metrics.update(coverage(predictions, calibration))
+            st["rows_in"] = metrics["rows"]
+            write_metrics(metrics, by_series, staging)
+
+        with stage(report, "publish"):
+            # new immutable model version, never an in-place overwrite (see model_registry.py)
+            model.write().save(os.path.join(staging, "model"))
+            if calibration is not None:
+                save_calibration(calibration, staging)
+            data = {**(data or {}), "through": str(df.agg(max_("timestamp")).first()[0])}
+            version = versions.publish(staging, "pipeline", "model", metrics, by_series, data=data, promote=promote)
+
+    return metrics, versions.output_path(version, "predictions.parquet"), versions.artifact_path(version)
+
+
+def run_pipeline(spark, args, report):
+    cache_dir = None if args.no_cache else args.cache_dir
+    with stage(report, "ingestion"):
+        power_df = load_csv(spark, args.power_csv, cache_dir=cache_dir)
+        weather_df = None
+        if args.weather_csv:
+            weather_df = load_csv(spark, args.weather_csv, layout="weather", cache_dir=cache_dir)
+
+    if args.mode == "forecast":
+        with stage(report, "forecast") as st:
+            model_path = resolve_model_path(args.output_dir, args.model_name, args.model_path)
+            model = load_model(model_path)
+            outlook = recursive_forecast(power_df, model, args.steps, lags=args.lags, windows=args.windows, period=args.period,
+                                         calendar=args.calendar)
+            calibration = load_calibration(model_path)
+            if calibration is not None:
+                outlook = add_intervals(outlook, calibration)
+            forecast_path = os.path.join(args.output_dir, "forecast.parquet")
+            outlook.write.mode("overwrite").parquet(forecast_path)
+        print(f"{args.steps}-step forecast written to", forecast_path)
+        return {}
+    if args.mode == "hierarchy":
+        return run_hierarchy(spark, args, power_df, report)
 
-    model = pipeline.fit(train)
-    predictions = model.transform(test)
+    def build(raw):
+        return create_features(raw, weather_df, lags=args.lags, windows=args.windows, weather_mode=args.weather_join,
+                               weather_tolerance=args.weather_tolerance, weather_interval=args.weather_interval,
+                               calendar=args.calendar, drop_unlabeled=args.mode != "score")
 
-    rmse_eval = RegressionEvaluator(labelCol="target", predictionCol="prediction", metricName="rmse")
-    mae_eval = RegressionEvaluator(labelCol="target", predictionCol="prediction", metricName="mae")
-    rmse = rmse_eval.evaluate(predictions)
-    mae = mae_eval.evaluate(predictions)
+    with stage(report, "features") as st:
+        if cache_dir and not args.no_feature_store:
+            # unchanged inputs reuse stored features; appended rows get features for themselves only
+            config = feature_config(args.lags, args.windows, weather_path=args.weather_csv, weather_mode=args.weather_join,
+                                    weather_tolerance=args.weather_tolerance, weather_interval=args.weather_interval,
+                                    calendar=args.calendar, drop_unlabeled=args.mode != "score")
+            df, st["feature_store"] = FeatureStore(spark, os.path.join(cache_dir, "features"), config,
+                                                   args.power_csv).load(power_df, build)
+        else:
+            df = build(power_df)
+        # cached by the first stage that reads it; no count here, which would cost an extra pass on every run
+        df = df.persist()
 
-    # save outputs
-    os.makedirs(output_dir, exist_ok=True)
-    preds_path = os.path.join(output_dir, "predictions.parquet")
-    predictions.select("timestamp", "target", "prediction").write.mode("overwrite").parquet(preds_path)
+    if args.mode == "backtest":
+        with stage(report, "backtest"):
+            metrics = run_backtest(df, build_pipeline, feature_columns(df), n_folds=args.folds, horizon=args.horizon,
+                                   fold_type=args.fold_type, train_periods=args.train_periods, parallelism=args.parallelism,
+                                   lags=args.lags, windows=args.windows, period=args.period, calendar=args.calendar)
+            report_path = write_report(metrics, args.output_dir)
+        for fold in metrics["folds"]:
+            print(f"Fold {fold['fold']} (cutoff {fold['cutoff']}): RMSE={fold['RMSE']:.3f} MAE={fold['MAE']:.3f}")
+        for h in metrics["by_horizon"]:
+            print(f"Horizon {h['horizon']}: RMSE={h['RMSE']:.3f} MAE={h['MAE']:.3f}")
+        print("Backtest report written to", report_path)
+        return metrics
+    if args.mode == "score":
+        with stage(report, "score"):
+            model_path = resolve_model_path(args.output_dir, args.model_name, args.model_path)
+            scores_path = score(df, model_path, os.path.join(args.output_dir, "scores.parquet"))
+        print("Predictions written to", scores_path)
+        return {}
 
-    # also write CSV sample
-    sample_csv = os.path.join(output_dir, "predictions_sample.csv")
-    predictions.select("timestamp", "target", "prediction").limit(500).toPandas().to_csv(sample_csv, index=False)
+    # recorded with every published model version; retrain compares it to skip unchanged data
+    data = {"version": data_version(args.power_csv, args.weather_csv)}
+    if args.mode == "retrain":
+        registry = ModelRegistry.for_model(args.output_dir, args.model_name)
+        current = registry.current()
+        features = feature_columns(df)
 
-    model_path = os.path.join(output_dir, model_name)
-    # PipelineModel save
-    model.write().overwrite().save(model_path)
+        def train(only, promote):
+            if args.per_series or (current is not None and current["kind"] == "per_series"):
+                base = registry.artifact_path(current) if only is not None else None
+                return train_per_series(df, features, args.output_dir, args.model_name, group_col=args.group_col,
+                                        data=data, promote=promote, only=only, base_path=base)
+            return train_and_evaluate(df, args.output_dir, args.model_name, report=report, data=data, promote=promote,
+                                      coverages=args.interval_coverage, lags=args.lags, windows=args.windows, period=args.period,
+                                      calendar=args.calendar, max_horizon=args.steps)
 
-    metrics = {"RMSE": rmse, "MAE": mae}
-    return metrics, preds_path, model_path
+        with stage(report, "retrain") as rt:
+            summary = retrain(df, registry, features, train, data, series_cols=[args.group_col],
+                              threshold=args.drift_threshold, drift_periods=args.drift_periods, force=args.force_retrain,
+                              gate_periods=args.gate_periods)
+            rt["action"] = summary["action"]
+        print("Retrain:", summary["action"], "- current model version", registry.current()["version"])
+        for d in summary.get("drifted", []):
+            print("  drifted:", d["series"], "MAE ratio", d["mae_ratio"])
+        return summary.get("candidate_metrics") or summary.get("metrics") or summary.get("recent") or {}
+    if args.mode == "tune":
+        with stage(report, "tune"):
+            board, model_path = tune(df, feature_columns(df), args.output_dir, args.model_name, search=args.search,
+                                     n_samples=args.samples, parallelism=args.parallelism, data=data)
+        metrics = board[0]
+        print(f"Evaluated {len(board)} candidates; best:", metrics)
+        print("Best model saved to", model_path)
+        if args.export_scorer:
+            print("NumPy scorer exported to", export_gbt(spark, model_path))
+        return metrics
+
+    if args.per_series:
+        with stage(report, "per_series"):
+            metrics, preds_path, registry_path = train_per_series(df, feature_columns(df), args.output_dir,
+                                                                  args.model_name, group_col=args.group_col, data=data)
+        print("Model Evaluation Metrics:", metrics)
+        print("Per-series model registry written to", registry_path)
+        return metrics
+
+    metrics, preds_path, model_path = train_and_evaluate(df, args.output_dir, args.model_name, report=report, data=data,
+                                                         coverages=args.interval_coverage, lags=args.lags,
+                                                         windows=args.windows, period=args.period, calendar=args.calendar,
+                                                         max_horizon=args.steps)
+    print("Model Evaluation Metrics:", metrics)
+    print("Model saved to", model_path)
+    if args.export_scorer:
+        print("NumPy scorer exported to", export_gbt(spark, model_path))
+
+    return metrics
+
+
+def run_hierarchy(spark, args, power_df, report):
+    """Fit one GBT on every node of the hierarchy (scaled per node), then reconcile holdout and outlook."""
+    with stage(report, "aggregate") as st:
+        mapping = spark.read.csv(args.hierarchy_map, header=True) if args.hierarchy_map else None
+        power = attach_levels(normalize_power(power_df), mapping, args.group_col, args.hierarchy_levels)
+        nodes, C = summing_matrix(leaf_membership(power, args.group_col, args.hierarchy_levels), args.group_col,
+                                  args.hierarchy_levels)
+        series, scales = scale_series(node_series(power, args.group_col, args.hierarchy_levels))
+        series = series.select("series", "timestamp", "power").persist()
+        scales = scales.persist()
+        st.update(nodes=len(nodes), leaves=C.shape[1], rows_out=series.count())
+
+    with stage(report, "features", rows_in=st["rows_out"]) as st:
+        df = create_features(series, lags=args.lags, windows=args.windows, series_col="series",
+                             calendar=args.calendar).persist()
+        st["rows_out"] = df.count()
+
+    with stage(report, "fit") as st:
+        train, test = time_split(df, test_fraction=0.2)
+        st["rows_in"] = train.count()
+        model = build_pipeline(feature_columns(df)).fit(train)
+
+    with stage(report, "reconcile") as st:
+        def predictions(frame):
+            scored = model.transform(frame).select("series", "timestamp", "target", "prediction")
+            return unscale(scored, scales).toPandas()
+
+        # in-sample one-step residuals estimate the MinT covariance
+        W = None
+        if args.reconcile in ("mint", "mint_shrink"):
+            fitted = predictions(train)
+            residuals, _ = wide(fitted.assign(residual=fitted["target"] - fitted["prediction"]), nodes, "residual")
+            W = mint_variance(residuals) if args.reconcile == "mint" else shrink_covariance(residuals)
+
+        holdout = predictions(test)
+        reconciled = reconcile_predictions(holdout, nodes, C, args.reconcile, W)
+        reconciled = reconciled.merge(holdout[["series", "timestamp", "target"]], on=["series", "timestamp"])
+        metrics = {"method": args.reconcile, "nodes": len(nodes), "leaves": C.shape[1], **level_metrics(reconciled)}
+        metrics_path = write_hierarchy_metrics(metrics, args.output_dir)
+
+        outlook = recursive_forecast(series, model, args.steps, series_col="series", lags=args.lags,
+                                     windows=args.windows, period=args.period, calendar=args.calendar)
+        outlook = unscale(outlook, scales).toPandas()
+        forecast = reconcile_predictions(outlook, nodes, C, args.reconcile, W)
+        forecast = forecast.merge(outlook[["series", "timestamp", "horizon"]], on=["series", "timestamp"], how="left")
+        forecast_path = os.path.join(args.output_dir, "hierarchy_forecast.parquet")
+        forecast[["level", "series", "horizon", "timestamp", "base", "prediction"]].to_parquet(forecast_path, index=False)
+        st["rows_out"] = len(forecast)
+
+    for name in ("base", "reconciled"):
+        print(f"{name.capitalize()} holdout RMSE by level:",
+              {r["level"]: round(r["RMSE"], 3) for r in metrics[name]["by_level"] if r["RMSE"] is not None})
+    print("Hierarchy metrics written to", metrics_path)
+    print(f"{args.steps}-step reconciled forecast written to", forecast_path)
+    return metrics["reconciled"]["overall"]
+
+
+def run_local(args, report):
+    with stage(report, "ingestion") as st:
+        power_pdf = read_csv_pandas(args.power_csv)
+        weather_pdf = read_csv_pandas(args.weather_csv, layout="weather") if args.weather_csv else None
+        st["rows_out"] = len(power_pdf)
+
+    with stage(report, "features", rows_in=st["rows_out"]) as st:
+        pdf = create_features_pandas(power_pdf, weather_pdf, lags=args.lags, windows=args.windows,
+                                     weather_mode=args.weather_join, weather_tolerance=args.weather_tolerance,
+                                     weather_interval=args.weather_interval, calendar=args.calendar)
+        st["rows_out"] = len(pdf)
+
+    metrics, preds_path, model_path = train_and_evaluate_local(pdf, args.output_dir, args.model_name, report=report,
+                                                               data={"version": data_version(args.power_csv, args.weather_csv)},
+                                                               coverages=args.interval_coverage, lags=args.lags,
+                                                               windows=args.windows, period=args.period,
+                                                               calendar=args.calendar, max_horizon=args.steps)
+    print("Model Evaluation Metrics:", metrics)
+    print("Model saved to", model_path)
+    return metrics
 
 
 def main():
     args = parse_args()
-    spark = SparkSession.builder.appName("PowerConsumptionForecasting").getOrCreate()
+    if args.mode == "rollback":
+        meta = ModelRegistry.for_model(args.output_dir, args.model_name).rollback(args.version)
+        print(f"Current model is now version {meta['version']} (created {meta['created']}, metrics {meta['metrics']})")
+        return None, {}
 
-    power_df = load_csv(spark, args.power_csv)
-    weather_df = None
-    if args.weather_csv:
-        weather_df = load_csv(spark, args.weather_csv)
+    # small train runs skip the JVM entirely (see local_engine.py)
+    engine = select_engine(args.engine, [args.power_csv, args.weather_csv], max_bytes=args.local_max_mb * 2**20,
+                           supported=local_supported(args))
+    if engine == "local":
+        spark = None
+    else:
+        # FAIR scheduling lets concurrent fits (backtest folds) share the executors
+        spark = SparkSession.builder.appName("PowerConsumptionForecasting").config("spark.scheduler.mode", "FAIR").getOrCreate()
 
-    df = create_features(power_df, weather_df)
-    metrics, preds_path, model_path = train_and_evaluate(df, args.output_dir, args.model_name)
-    print("Model Evaluation Metrics:", metrics)
+    if args.mode == "stream":
+        model_path = resolve_model_path(args.output_dir, args.model_name, args.model_path)
+        query = stream_forecasts(
+            spark, args.landing_dir,
+            model_path=model_path,
+            output_path=os.path.join(args.output_dir, "stream_forecasts.parquet"),
+            checkpoint_dir=args.checkpoint_dir or os.path.join(args.output_dir, "_stream_checkpoint"),
+            lags=args.lags, windows=args.windows, trigger_seconds=args.trigger_seconds, once=args.once,
+            calendar=args.calendar, calibration=load_calibration(model_path),
+            history=load_csv(spark, args.power_csv) if args.power_csv else None,
+        )
+        print("Streaming forecasts from", args.landing_dir, "(Ctrl+C to stop)")
+        try:
+            query.awaitTermination()
+        except KeyboardInterrupt:
+            query.stop()
+        return spark, {}
 
+    report = RunReport(spark, args.mode, params={k: v for k, v in vars(args).items() if v is not None}, engine=engine)
+    try:
+        metrics = run_local(args, report) if engine == "local" else run_pipeline(spark, args, report)
+        report.finish("succeeded", metrics)
+    except BaseException:
+        report.finish("failed")
+        raise
+    finally:
+        report_path = report.write_json(args.report_path or os.path.join(args.output_dir, "run_report.json"))
+        print("Run report written to", report_path)
+        if args.prometheus_file:
+            report.write_prometheus(args.prometheus_file)
     return spark, metrics
 
 
 if __name__ == "__main__":
     import sys
+    import threading
     spark, metrics = main()
-    if "--keep-ui" in sys.argv:
-        print("Spark Web UI available at http://localhost:4040. Press Enter to stop.")
-        try:
-            input()
-        except KeyboardInterrupt:
-            pass
-    spark.stop()
+    if spark is not None:
+        if "--keep-ui" in sys.argv:
+            print("Spark Web UI available at http://localhost:4040. Press Enter to stop.")
+            try:
+                input()
+            except EOFError:
+                # no console (e.g. started by run_all.py's supervisor): keep the UI until the process is stopped
+                try:
+                    threading.Event().wait()
+                except KeyboardInterrupt:
+                    pass
+            except KeyboardInterrupt:
+                pass
+        spark.stop()
@@ -0,0 +1,78 @@
+"""Export a saved GBT PipelineModel to the array file read by `numpy_scorer`.
+
+The tree nodes are read from the GBT stage's saved `data` Parquet (one row
+per node, with preorder node ids per tree) and flattened into global arrays:
+feature index, threshold, left/right child, leaf value, plus each tree's
+root and weight. The VectorAssembler input columns are stored alongside, so
+the scorer knows which column feeds each feature index.
+"""
+import json
+import os
+
+import numpy as np
+from pyspark.ml import PipelineModel
+from pyspark.ml.feature import VectorAssembler
+from pyspark.ml.regression import GBTRegressionModel
+
+from numpy_scorer import FORMAT_VERSION
+from scoring import LOCAL_MODEL_SUFFIX
+
+
+def _stage_dir(model_path, index, stage):
+    return os.path.join(model_path, "stages", f"{index}_{stage.uid}")
+
+
+def export_gbt(spark, model_path, out_path=None):
+    """Write `<model_path>.npz` (or `out_path`) for the PipelineModel saved at `model_path`."""
+    if model_path.endswith(LOCAL_MODEL_SUFFIX):
+        raise ValueError(f"{model_path} is a scikit-learn model from the local engine; only Spark GBT pipelines "
+                         "can be exported (train with --engine spark)")
+    model = PipelineModel.load(model_path)
+    assembler = next((s for s in model.stages if isinstance(s, VectorAssembler)), None)
+    gbt_index, gbt = next(((i, s) for i, s in enumerate(model.stages) if isinstance(s, GBTRegressionModel)), (None, None))
+    if assembler is None or gbt is None:
+        raise ValueError(f"{model_path} is not a VectorAssembler + GBTRegressor pipeline")
+
+    nodes = (
+        spark.read.parquet(os.path.join(_stage_dir(model_path, gbt_index, gbt), "data"))
+        .selectExpr("treeID", "nodeData.id AS id", "nodeData.prediction AS prediction",
+                    "nodeData.leftChild AS leftChild", "nodeData.rightChild AS rightChild",
+                    "nodeData.split.featureIndex AS featureIndex",
+                    "nodeData.split.leftCategoriesOrThreshold AS split",
+                    "nodeData.split.numCategories AS numCategories")
+        .orderBy("treeID", "id")
+        .toPandas()
+    )
+    if (nodes["numCategories"] > 0).any():
+        raise ValueError("Categorical splits are not supported by the NumPy scorer")
+
+    n_trees = gbt.getNumTrees
+    sizes = nodes.groupby("treeID").size().reindex(range(n_trees), fill_value=0).to_numpy()
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    offset = roots[nodes["treeID"].to_numpy()]
+    is_leaf = nodes["leftChild"].to_numpy() < 0
+
+    left = np.where(is_leaf, -1, nodes["leftChild"].to_numpy() + offset).astype(np.int64)
+    right = np.where(is_leaf, -1, nodes["rightChild"].to_numpy() + offset).astype(np.int64)
+    feature = np.where(is_leaf, -1, nodes["featureIndex"].to_numpy()).astype(np.int64)
+    threshold = np.array([s[0] if not leaf else np.nan for s, leaf in zip(nodes["split"], is_leaf)], dtype=np.float64)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "feature_cols": assembler.getInputCols(),
+        "max_depth": int(gbt.getOrDefault("maxDepth")),
+        "num_trees": int(n_trees),
+    }
+    out_path = out_path or model_path.rstrip("/\\") + ".npz"
+    np.savez_compressed(
+        out_path,
+        feature=feature,
+        threshold=threshold,
+        left=left,
+        right=right,
+        value=nodes["prediction"].to_numpy(dtype=np.float64),
+        roots=roots,
+        weights=np.asarray(gbt.treeWeights, dtype=np.float64),
+        meta=np.array(json.dumps(meta)),
+    )
+    return out_path
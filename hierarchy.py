@@ -0,0 +1,242 @@
+"""Hierarchical series and forecast reconciliation.
+
+Apartments (the leaf series, `--group-col`) roll up into the levels given by
+`--hierarchy-levels`, e.g. `Building_ID,Feeder_ID`, and into one grid
+`Total`. A level comes from a column of the power data or, failing that,
+from the mapping file (`--hierarchy-map`, one row per leaf). Levels do not
+have to nest: every node is the sum of the leaves mapped to it.
+
+`node_series` builds the series of every node in one Spark aggregation
+(each reading is exploded into the nodes it belongs to). Nodes are named
+`<level>=<id>`, and `Total`.
+
+The base forecasts of all nodes are reconciled at once on the driver. The
+summing matrix S = [C; I] is kept sparse: C has one row per aggregate node
+and one column per leaf. Methods:
+
+- bottom_up: leaf forecasts summed up; aggregate forecasts are ignored
+- ols: least-squares projection onto coherent forecasts (W = I)
+- mint: MinT with the diagonal of the in-sample residual covariance
+  (variance scaling), which stays sparse
+- mint_shrink: MinT with the shrunk full residual covariance. It needs a
+  dense n x n matrix, so it is limited to MAX_DENSE_NODES nodes.
+
+For a diagonal W the reconciled leaves are
+    b + W_b C' (W_a + C W_b C')^-1 (a - C b)
+where a and b are the aggregate and leaf base forecasts. Only a sparse
+system of size (aggregate nodes) is factorized, once for all periods, so
+tens of thousands of leaves cost a few sparse products.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse as sp
+from pyspark.sql.functions import abs as abs_, array, avg, broadcast, col, concat, explode, lit, struct, sum as sum_, when
+from scipy.sparse.linalg import splu
+
+from evaluation import evaluate_pandas
+
+TOTAL = "Total"
+METHODS = ("bottom_up", "ols", "mint", "mint_shrink")
+
+# mint_shrink solves with a dense covariance of this many nodes at most
+MAX_DENSE_NODES = 5000
+
+
+def parse_levels(value):
+    """Parse a CLI value such as 'Building_ID,Feeder_ID'."""
+    return tuple(c.strip() for c in value.split(",") if c.strip())
+
+
+def attach_levels(power, mapping, leaf_col="Apartment_ID", levels=()):
+    """Add the level columns that are not in `power` from the `mapping` frame (joined on `leaf_col`)."""
+    if leaf_col not in power.columns:
+        raise ValueError(f"Power data has no series column {leaf_col!r}")
+    missing = [c for c in levels if c not in power.columns]
+    if not missing:
+        return power
+    if mapping is None:
+        raise ValueError(f"Hierarchy levels {missing} are not power columns; pass --hierarchy-map")
+    absent = [c for c in (leaf_col, *missing) if c not in mapping.columns]
+    if absent:
+        raise ValueError(f"Hierarchy mapping has no columns {absent}")
+    lookup = mapping.select(col(leaf_col).cast("string").alias(leaf_col), *missing).dropDuplicates()
+    power = power.withColumn(leaf_col, col(leaf_col).cast("string"))
+    return power.join(broadcast(lookup), on=leaf_col, how="left")
+
+
+def leaf_membership(power, leaf_col="Apartment_ID", levels=()):
+    """pandas frame with one row per leaf and its node at every level."""
+    return power.select(leaf_col, *levels).distinct().toPandas()
+
+
+def node_name(level, value):
+    return f"{level}={value}"
+
+
+def summing_matrix(membership, leaf_col="Apartment_ID", levels=()):
+    """Return (nodes, C): nodes as (level, series) pairs, aggregates first, and the sparse aggregation matrix C."""
+    if membership[list(levels)].isna().any(axis=None):
+        bad = membership.loc[membership[list(levels)].isna().any(axis=1), leaf_col].head(5).tolist()
+        raise ValueError(f"Leaves without a node at every hierarchy level, e.g. {bad}")
+    duplicated = membership[leaf_col].duplicated(keep=False)
+    if duplicated.any():
+        bad = membership.loc[duplicated, leaf_col].unique()[:5].tolist()
+        raise ValueError(f"Leaves mapped to more than one node of a level, e.g. {bad}")
+
+    membership = membership.astype({leaf_col: str}).sort_values(leaf_col).reset_index(drop=True)
+    n_leaves = len(membership)
+    leaf_index = np.arange(n_leaves)
+
+    nodes = [(TOTAL, TOTAL)]
+    rows, cols = [np.zeros(n_leaves, dtype=np.int64)], [leaf_index]
+    for level in levels:
+        codes, values = pd.factorize(membership[level].astype(str), sort=True)
+        rows.append(len(nodes) + codes)
+        cols.append(leaf_index)
+        nodes.extend((level, node_name(level, v)) for v in values)
+    n_agg = len(nodes)
+    nodes.extend((leaf_col, node_name(leaf_col, v)) for v in membership[leaf_col].astype(str))
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    C = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_agg, n_leaves))
+    return nodes, C
+
+
+def node_series(power, leaf_col="Apartment_ID", levels=()):
+    """(level, series, timestamp, power) for every node of the hierarchy, in one aggregation."""
+    def node(level):
+        return struct(lit(level).alias("level"), concat(lit(f"{level}="), col(level).cast("string")).alias("series"))
+
+    nodes = array(struct(lit(TOTAL).alias("level"), lit(TOTAL).alias("series")), *[node(c) for c in levels],
+                  node(leaf_col))
+    return (power.where(col("power").isNotNull())
+            .select(explode(nodes).alias("node"), "timestamp", "power")
+            .groupBy("node.level", "node.series", "timestamp")
+            .agg(sum_("power").alias("power")))
+
+
+def scale_series(series):
+    """Divide each node's power by its mean absolute value, so one model fits leaves and totals alike.
+
+    Returns (scaled series, per-node scales).
+    """
+    scales = series.groupBy("series").agg(avg(abs_(col("power"))).alias("scale"))
+    scales = scales.withColumn("scale", when(col("scale") > 0, col("scale")).otherwise(lit(1.0)))
+    scaled = series.join(broadcast(scales), on="series").withColumn("power", col("power") / col("scale"))
+    return scaled.drop("scale"), scales
+
+
+def unscale(df, scales, columns=("target", "prediction")):
+    df = df.join(broadcast(scales), on="series")
+    for c in columns:
+        if c in df.columns:
+            df = df.withColumn(c, col(c) * col("scale"))
+    return df.drop("scale")
+
+
+def wide(pdf, nodes, value_col):
+    """(nodes x timestamps) matrix of `value_col` in node order, NaN where a node has no row; also the timestamps."""
+    table = pdf.pivot_table(index="series", columns="timestamp", values=value_col, aggfunc="first")
+    table = table.reindex([s for _, s in nodes])
+    return table.to_numpy(dtype=np.float64), table.columns
+
+
+def mint_variance(residuals):
+    """Per-node mean squared residual, the diagonal of the MinT covariance (rows: nodes, NaN for no residual)."""
+    with np.errstate(invalid="ignore"):
+        variance = np.nanmean(np.square(residuals), axis=1)
+    known = variance[np.isfinite(variance) & (variance > 0)]
+    fallback = known.mean() if len(known) else 1.0
+    # nodes without residuals get the mean; a floor keeps W invertible
+    variance = np.where(np.isfinite(variance), variance, fallback)
+    return np.maximum(variance, fallback * 1e-9)
+
+
+def shrink_covariance(residuals):
+    """Residual covariance shrunk towards its diagonal (Schafer-Strimmer), rows of `residuals` being nodes."""
+    x = np.nan_to_num(residuals).T
+    t = x.shape[0]
+    if t < 2:
+        raise ValueError("mint_shrink needs residuals for at least two periods")
+    cov = x.T @ x / t
+    sd = np.sqrt(np.diag(cov))
+    sd[sd == 0] = 1.0
+    xs = x / sd
+    corr = xs.T @ xs / t
+    v = (np.square(xs).T @ np.square(xs) - np.square(xs.T @ xs) / t) / (t * (t - 1))
+    np.fill_diagonal(v, 0.0)
+    d = np.square(corr)
+    np.fill_diagonal(d, 0.0)
+    lam = float(np.clip(v.sum() / d.sum(), 0.0, 1.0)) if d.sum() > 0 else 1.0
+    shrunk = (1.0 - lam) * cov
+    diag = np.diag(cov)
+    floor = (diag[diag > 0].mean() if (diag > 0).any() else 1.0) * 1e-9
+    shrunk[np.diag_indices_from(shrunk)] = np.maximum(diag, floor)
+    return shrunk
+
+
+def reconcile(base, C, method="mint", W=None):
+    """Coherent forecasts from `base` (nodes x periods, aggregates first, in `summing_matrix` order).
+
+    `W` is the residual variance per node for mint, the covariance for mint_shrink; ols and bottom_up ignore it.
+    """
+    n_agg, n_leaves = C.shape
+    base = np.asarray(base, dtype=np.float64)
+    agg, bottom = base[:n_agg], base[n_agg:]
+    if method == "bottom_up":
+        leaves = bottom
+    elif method in ("ols", "mint"):
+        w = np.ones(n_agg + n_leaves) if method == "ols" else np.asarray(W, dtype=np.float64)
+        if method == "mint" and w.shape != (n_agg + n_leaves,):
+            raise ValueError("mint needs one residual variance per node")
+        w_agg, w_leaves = w[:n_agg], w[n_agg:]
+        system = (sp.diags(w_agg) + C @ sp.diags(w_leaves) @ C.T).tocsc()
+        leaves = bottom + w_leaves[:, None] * (C.T @ splu(system).solve(agg - C @ bottom))
+    elif method == "mint_shrink":
+        if n_agg + n_leaves > MAX_DENSE_NODES:
+            raise ValueError(f"mint_shrink is limited to {MAX_DENSE_NODES} nodes; use mint")
+        S = sp.vstack([C, sp.identity(n_leaves)]).toarray()
+        w_inv_s = scipy.linalg.solve(W, S, assume_a="pos")
+        leaves = scipy.linalg.solve(S.T @ w_inv_s, w_inv_s.T @ base, assume_a="pos")
+    else:
+        raise ValueError(f"Unknown reconciliation method {method!r} (expected one of {METHODS})")
+    return np.vstack([C @ leaves, leaves])
+
+
+def reconcile_predictions(pdf, nodes, C, method="mint", W=None):
+    """Reconcile long-format base predictions (series, timestamp, prediction) for every timestamp at once.
+
+    Returns (level, series, timestamp, base, prediction) for every node and timestamp; a node without a base
+    prediction for a timestamp counts as 0.
+    """
+    base, timestamps = wide(pdf, nodes, "prediction")
+    reconciled = reconcile(np.nan_to_num(base), C, method, W)
+    n, t = base.shape
+    return pd.DataFrame({
+        "level": np.repeat([level for level, _ in nodes], t),
+        "series": np.repeat([s for _, s in nodes], t),
+        "timestamp": np.tile(np.asarray(timestamps), n),
+        "base": base.ravel(),
+        "prediction": reconciled.ravel(),
+    })
+
+
+def level_metrics(pdf):
+    """Holdout metrics of the base and the reconciled predictions, overall and per level."""
+    out = {}
+    for name, column in (("base", "base"), ("reconciled", "prediction")):
+        overall, by_level = evaluate_pandas(pdf[["level", "target"]].assign(prediction=pdf[column]), ["level"])
+        out[name] = {"overall": overall, "by_level": by_level}
+    return out
+
+
+def write_hierarchy_metrics(metrics, output_dir, name="hierarchy_metrics.json"):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+    with open(path, "w") as fh:
+        json.dump(metrics, fh, indent=2, default=str)
+    return path
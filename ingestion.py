@@ -0,0 +1,264 @@
+"""Schema-declared CSV ingestion with a content-hashed Parquet cache.
+
+The power and weather layouts used by this project are known up front, so
+instead of `inferSchema=True` (which scans every file twice) the schema is
+built from the CSV header and a table of known column types, and the file is
+read in a single pass. The normalized frame (canonical `timestamp`/`power`
+columns, numeric `Month`) is stored as Parquet under a key derived from the
+file content, so reruns over the same history skip the CSV parse entirely.
+
+Example:
+  from ingestion import load_power, load_weather
+  power_df = load_power(spark, "power.csv", cache_dir="outputs/cache")
+"""
+import glob
+import hashlib
+import os
+import shutil
+import uuid
+from itertools import chain
+
+import pandas as pd
+from pyspark.sql.functions import coalesce, col, concat, create_map, lit, lower, to_timestamp, trim
+from pyspark.sql.types import DoubleType, IntegerType, StringType, StructField, StructType, TimestampType
+
+# bump when the normalization below changes so stale caches are not reused
+CACHE_VERSION = 1
+
+MONTHS = {
+    "jan": 1, "january": 1,
+    "feb": 2, "february": 2,
+    "mar": 3, "march": 3,
+    "apr": 4, "april": 4,
+    "may": 5,
+    "jun": 6, "june": 6,
+    "jul": 7, "july": 7,
+    "aug": 8, "august": 8,
+    "sep": 9, "sept": 9, "september": 9,
+    "oct": 10, "october": 10,
+    "nov": 11, "november": 11,
+    "dec": 12, "december": 12,
+}
+
+# column names that hold the target in the power layouts (checked case-insensitively)
+POWER_COLUMNS = ("power", "power_draw", "mw", "value", "usage", "power_usage", "monthly_kwh")
+
+POWER_TYPES = {
+    "apartment_id": StringType(),
+    "year": IntegerType(),
+    "month": StringType(),
+    "season": StringType(),
+    "timestamp": TimestampType(),
+}
+POWER_TYPES.update({name: DoubleType() for name in POWER_COLUMNS})
+
+_HASHES = {}
+
+
+def _weather_name(name):
+    lc = name.lower()
+    if "temp" in lc:
+        return "temperature"
+    if "humid" in lc:
+        return "humidity"
+    if "cloud" in lc or "cover" in lc:
+        return "cloud_cover"
+    return None
+
+
+def input_files(path):
+    """Expand a file, directory or glob into a sorted list of files."""
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path) if not f.startswith((".", "_"))]
+    else:
+        files = glob.glob(path)
+    files = sorted(f for f in files if os.path.isfile(f))
+    if not files:
+        raise FileNotFoundError(f"No input files found at {path}")
+    return files
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-256 over the content of every file in `path` (in sorted order)."""
+    files = input_files(path)
+    # files are hashed once per process while their size and mtime stay the same
+    key = tuple((f, os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files)
+    if key not in _HASHES:
+        h = hashlib.sha256()
+        for f in files:
+            h.update(os.path.basename(f).encode())
+            with open(f, "rb") as fh:
+                for chunk in iter(lambda: fh.read(chunk_size), b""):
+                    h.update(chunk)
+        _HASHES[key] = h.hexdigest()
+    return _HASHES[key]
+
+
+def data_version(*paths):
+    """Content fingerprint of a set of inputs (None entries are skipped)."""
+    h = hashlib.sha256()
+    for p in paths:
+        if p:
+            h.update(content_hash(p).encode())
+    return h.hexdigest()
+
+
+def read_header(path):
+    with open(input_files(path)[0], "r", encoding="utf-8-sig") as fh:
+        line = fh.readline()
+    return [c.strip().strip('"') for c in line.rstrip("\r\n").split(",")]
+
+
+def power_schema(header):
+    return StructType([StructField(c, POWER_TYPES.get(c.lower(), StringType()), True) for c in header])
+
+
+def weather_schema(header):
+    fields = []
+    for c in header:
+        if c.lower() == "timestamp":
+            dtype = TimestampType()
+        elif _weather_name(c):
+            dtype = DoubleType()
+        else:
+            dtype = StringType()
+        fields.append(StructField(c, dtype, True))
+    return StructType(fields)
+
+
+def month_number(c):
+    """Map month names ('Jan', 'january') or numbers ('1') to 1-12 with a single map lookup."""
+    months = create_map(*[lit(x) for x in chain.from_iterable(MONTHS.items())])
+    return coalesce(months[trim(lower(c))], trim(c).cast("int"))
+
+
+def normalize_power(df):
+    """Rename to the canonical `timestamp`/`power` columns and derive the timestamp if needed."""
+    by_lower = {c.lower(): c for c in df.columns}
+    if "timestamp" in by_lower:
+        df = df.withColumnRenamed(by_lower["timestamp"], "timestamp")
+        df = df.withColumn("timestamp", to_timestamp(col("timestamp")))
+    elif "year" in by_lower and "month" in by_lower:
+        df = df.withColumnRenamed(by_lower["year"], "Year").withColumnRenamed(by_lower["month"], "Month")
+        df = df.withColumn("Month", month_number(col("Month")))
+        df = df.withColumn("Year", col("Year").cast("int"))
+        df = df.withColumn("timestamp", to_timestamp(concat(col("Year"), lit("-"), col("Month"), lit("-01")), "yyyy-M-d"))
+    else:
+        raise ValueError("power CSV must contain a 'timestamp' column or 'Year' and 'Month' columns")
+
+    power_col = next((by_lower[c] for c in POWER_COLUMNS if c in by_lower), None)
+    if power_col is None:
+        raise ValueError("power CSV must contain a numeric power column (e.g. 'power' or 'Monthly_kWh')")
+    return df.withColumnRenamed(power_col, "power").withColumn("power", col("power").cast("double"))
+
+
+def normalize_weather(df):
+    """Rename weather columns to `timestamp`, `temperature`, `humidity` and `cloud_cover`."""
+    for c in df.columns:
+        new = "timestamp" if c.lower() == "timestamp" else _weather_name(c)
+        if new and new != c:
+            df = df.withColumnRenamed(c, new)
+    if "timestamp" not in df.columns:
+        raise ValueError("weather CSV must contain a 'timestamp' column")
+    return df.withColumn("timestamp", to_timestamp(col("timestamp")))
+
+
+def normalize_power_pandas(pdf):
+    """pandas counterpart of `normalize_power`."""
+    by_lower = {c.lower(): c for c in pdf.columns}
+    if "timestamp" in by_lower:
+        pdf = pdf.rename(columns={by_lower["timestamp"]: "timestamp"})
+        pdf["timestamp"] = pd.to_datetime(pdf["timestamp"], errors="coerce")
+    elif "year" in by_lower and "month" in by_lower:
+        pdf = pdf.rename(columns={by_lower["year"]: "Year", by_lower["month"]: "Month"})
+        month = pdf["Month"].astype(str).str.strip().str.lower()
+        pdf["Month"] = month.map(MONTHS).fillna(pd.to_numeric(month, errors="coerce")).astype("Int64")
+        pdf["Year"] = pd.to_numeric(pdf["Year"], errors="coerce").astype("Int64")
+        pdf["timestamp"] = pd.to_datetime(pd.DataFrame({"year": pdf["Year"], "month": pdf["Month"], "day": 1}),
+                                          errors="coerce")
+    else:
+        raise ValueError("power CSV must contain a 'timestamp' column or 'Year' and 'Month' columns")
+
+    power_col = next((by_lower[c] for c in POWER_COLUMNS if c in by_lower), None)
+    if power_col is None:
+        raise ValueError("power CSV must contain a numeric power column (e.g. 'power' or 'Monthly_kWh')")
+    pdf = pdf.rename(columns={power_col: "power"})
+    pdf["power"] = pd.to_numeric(pdf["power"], errors="coerce").astype("float64")
+    return pdf
+
+
+def normalize_weather_pandas(pdf):
+    """pandas counterpart of `normalize_weather`."""
+    renames = {}
+    for c in pdf.columns:
+        new = "timestamp" if c.lower() == "timestamp" else _weather_name(c)
+        if new and new != c:
+            renames[c] = new
+    pdf = pdf.rename(columns=renames)
+    if "timestamp" not in pdf.columns:
+        raise ValueError("weather CSV must contain a 'timestamp' column")
+    pdf["timestamp"] = pd.to_datetime(pdf["timestamp"], errors="coerce")
+    for c in ("temperature", "humidity", "cloud_cover"):
+        if c in pdf.columns:
+            pdf[c] = pd.to_numeric(pdf[c], errors="coerce").astype("float64")
+    return pdf
+
+
+def _cached_parquet(spark, path, layout, build, cache_dir):
+    if not cache_dir:
+        return build()
+    key = f"{layout}-v{CACHE_VERSION}-{content_hash(path)[:32]}"
+    cache_path = os.path.join(cache_dir, key + ".parquet")
+    if not os.path.exists(os.path.join(cache_path, "_SUCCESS")):
+        # write to a scratch directory and rename, so a crashed run never leaves a half cache
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, f".{key}-{uuid.uuid4().hex}.tmp")
+        build().write.mode("overwrite").parquet(tmp_path)
+        if os.path.exists(cache_path):
+            shutil.rmtree(cache_path)
+        os.replace(tmp_path, cache_path)
+    return spark.read.parquet(cache_path)
+
+
+def is_parquet(path):
+    if path.rstrip("/\\").endswith(".parquet"):
+        return True
+    return os.path.isdir(path) and any(f.endswith(".parquet") for f in os.listdir(path))
+
+
+def load_power(spark, path, cache_dir=None):
+    """Read a power CSV in one pass and return the normalized frame (cached when `cache_dir` is set).
+
+    Parquet inputs already carry a schema and are read directly, without caching.
+    """
+    if is_parquet(path):
+        return normalize_power(spark.read.parquet(path))
+
+    def build():
+        raw = spark.read.csv(path, header=True, schema=power_schema(read_header(path)))
+        return normalize_power(raw)
+    return _cached_parquet(spark, path, "power", build, cache_dir)
+
+
+def read_csv_pandas(path, layout="power"):
+    """Read a power (or weather) CSV or Parquet input in-process and normalize it like the Spark loaders."""
+    if is_parquet(path):
+        pdf = pd.read_parquet(path)
+    else:
+        header = read_header(path)
+        if layout == "weather":
+            dtypes = {c: str for c in header if c.lower() != "timestamp" and not _weather_name(c)}
+        else:
+            dtypes = {c: str for c in header if isinstance(POWER_TYPES.get(c.lower(), StringType()), StringType)}
+        pdf = pd.concat([pd.read_csv(f, dtype=dtypes, encoding="utf-8-sig") for f in input_files(path)],
+                        ignore_index=True)
+        pdf.columns = [c.strip() for c in pdf.columns]
+    return normalize_weather_pandas(pdf) if layout == "weather" else normalize_power_pandas(pdf)
+
+
+def load_weather(spark, path, cache_dir=None):
+    """Read a weather CSV in one pass and return the normalized frame (cached when `cache_dir` is set)."""
+    def build():
+        raw = spark.read.csv(path, header=True, schema=weather_schema(read_header(path)))
+        return normalize_weather(raw)
+    return _cached_parquet(spark, path, "weather", build, cache_dir)
@@ -0,0 +1,207 @@
+"""Stage-level timing and Spark metrics for a pipeline run.
+
+Every stage of a run (ingestion, features, fit, evaluate, write, ...) is
+wrapped in `RunReport.stage`, which records its wall time and any row counts
+the stage already has at hand. When a stage ends, the Spark jobs submitted
+during it are looked up in the application status store through the UI's
+REST API, and their job, stage and task counts, shuffle bytes, spill and
+input/output records are added to the stage record. Row counts of lazily
+built frames come from those records rather than from extra `count()` jobs;
+a cached frame is computed, and reported, by the first stage that reads it.
+This also covers jobs submitted from worker threads (backtest folds, tuning
+candidates), which do not inherit job groups.
+
+At the end of the run the report holds the peak driver memory (Python RSS
+and, when Spark reports it, JVM heap) and is written as JSON and optionally
+as a Prometheus text file for node_exporter's textfile collector. Without
+the Spark UI (spark.ui.enabled=false) only timings, rows and memory are
+recorded; the same applies to runs on the in-process engine, which pass no
+SparkSession.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from urllib.error import URLError
+from urllib.request import urlopen
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_VERSION = 1
+
+STAGE_METRICS = ("shuffleReadBytes", "shuffleWriteBytes", "memoryBytesSpilled", "diskBytesSpilled",
+                 "inputBytes", "outputBytes", "inputRecords", "outputRecords")
+
+# seconds to wait for the status store to record the end of a stage's jobs
+SETTLE_SECONDS = 5.0
+
+
+def snake(name):
+    return "".join("_" + c.lower() if c.isupper() else c for c in name)
+
+
+def peak_rss_bytes():
+    """Peak resident memory of the driver's Python process (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_spark_time(value):
+    """Epoch seconds of a status-store timestamp such as '2024-01-31T10:00:00.123GMT'."""
+    return datetime.strptime(value.replace("GMT", ""), "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=timezone.utc).timestamp()
+
+
+def stage(report, name, **rows):
+    """`report.stage(name)`, or a no-op context when there is no report."""
+    return report.stage(name, **rows) if report is not None else nullcontext({})
+
+
+class RunReport:
+    def __init__(self, spark, mode, params=None, engine="spark"):
+        self.spark = spark
+        self.sc = spark.sparkContext if spark is not None else None
+        self.started = time.time()
+        self.report = {
+            "version": REPORT_VERSION,
+            "mode": mode,
+            "engine": engine,
+            "status": "running",
+            "app_id": self.sc.applicationId if self.sc else None,
+            "spark_version": spark.version if spark is not None else None,
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "params": params or {},
+            "stages": [],
+        }
+        self._api = None
+        if self.sc and self.sc.uiWebUrl:
+            self._api = f"{self.sc.uiWebUrl.rstrip('/')}/api/v1/applications/{self.sc.applicationId}"
+
+    def _get(self, path):
+        if self._api is None:
+            return None
+        try:
+            with urlopen(f"{self._api}/{path}", timeout=10) as resp:
+                return json.load(resp)
+        except (URLError, OSError, ValueError):
+            return None
+
+    def _jobs_between(self, start, end):
+        deadline = time.time() + SETTLE_SECONDS
+        while True:
+            jobs = self._get("jobs")
+            if jobs is None:
+                return None
+            # 1 ms slack: submission times are truncated to milliseconds
+            inside = [j for j in jobs if "submissionTime" in j
+                      and start - 0.001 <= parse_spark_time(j["submissionTime"]) <= end + 0.001]
+            if all(j["status"] != "RUNNING" for j in inside) or time.time() > deadline:
+                return inside
+            time.sleep(0.1)
+
+    def _spark_metrics(self, start, end):
+        jobs = self._jobs_between(start, end)
+        if jobs is None:
+            return {}
+        stage_ids = {s for j in jobs for s in j.get("stageIds", [])}
+        stages = [s for s in (self._get("stages") or [])
+                  if s["stageId"] in stage_ids and s["status"] not in ("SKIPPED", "PENDING")]
+        out = {
+            "jobs": len(jobs),
+            "failed_jobs": sum(j["status"] == "FAILED" for j in jobs),
+            "stages": len(stages),
+            "tasks": sum(s.get("numCompleteTasks", 0) + s.get("numFailedTasks", 0) for s in stages),
+        }
+        for key in STAGE_METRICS:
+            out[snake(key)] = sum(s.get(key, 0) for s in stages)
+        return out
+
+    @contextmanager
+    def stage(self, name, **rows):
+        """Time a block; set `rows_in` / `rows_out` on the yielded record."""
+        record = {"name": name, **rows}
+        start = time.time()
+        try:
+            yield record
+        finally:
+            end = time.time()
+            record["seconds"] = end - start
+            record.update(self._spark_metrics(start, end))
+            self.report["stages"].append(record)
+
+    def _driver_jvm_peak(self):
+        for executor in self._get("allexecutors") or []:
+            if executor.get("id") == "driver":
+                return (executor.get("peakMemoryMetrics") or {}).get("JVMHeapMemory")
+        return None
+
+    def finish(self, status, metrics=None):
+        finished = time.time()
+        self.report.update({
+            "status": status,
+            "finished": datetime.fromtimestamp(finished, timezone.utc).isoformat(),
+            "seconds": finished - self.started,
+            "driver_peak_rss_bytes": peak_rss_bytes(),
+            "driver_jvm_peak_heap_bytes": self._driver_jvm_peak(),
+            "metrics": metrics or {},
+        })
+        return self.report
+
+    def write_json(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as fh:
+            json.dump(self.report, fh, indent=2, default=str)
+        return path
+
+    def write_prometheus(self, path, prefix="power_forecasting"):
+        """Write gauges in the Prometheus text format, atomically (the textfile collector may read at any time)."""
+        r = self.report
+        mode = r["mode"]
+        lines = []
+
+        def gauge(name, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_str = ",".join(f'{k}="{v}"' for k, v in {"mode": mode, **labels}.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {float(value)}")
+
+        gauge("run_duration_seconds", "Wall time of the last run", [({}, r.get("seconds"))])
+        gauge("run_success", "1 if the last run succeeded", [({}, r["status"] == "succeeded")])
+        gauge("run_finished_timestamp_seconds", "Unix time the last run finished", [({}, time.time())])
+        gauge("driver_peak_rss_bytes", "Peak resident memory of the driver process", [({}, r.get("driver_peak_rss_bytes"))])
+        gauge("driver_jvm_peak_heap_bytes", "Peak JVM heap of the driver", [({}, r.get("driver_jvm_peak_heap_bytes"))])
+        per_stage = (
+            ("stage_duration_seconds", "seconds", "Wall time per pipeline stage"),
+            ("stage_rows_in", "rows_in", "Rows entering a pipeline stage"),
+            ("stage_rows_out", "rows_out", "Rows produced by a pipeline stage"),
+            ("stage_spark_jobs", "jobs", "Spark jobs run by a pipeline stage"),
+            ("stage_spark_stages", "stages", "Spark stages run by a pipeline stage"),
+            ("stage_shuffle_read_bytes", "shuffle_read_bytes", "Shuffle bytes read by a pipeline stage"),
+            ("stage_shuffle_write_bytes", "shuffle_write_bytes", "Shuffle bytes written by a pipeline stage"),
+            ("stage_memory_spilled_bytes", "memory_bytes_spilled", "Bytes spilled from memory by a pipeline stage"),
+            ("stage_disk_spilled_bytes", "disk_bytes_spilled", "Bytes spilled to disk by a pipeline stage"),
+            ("stage_input_records", "input_records", "Records read from storage by a pipeline stage"),
+            ("stage_output_records", "output_records", "Records written to storage by a pipeline stage"),
+        )
+        for name, key, help_text in per_stage:
+            gauge(name, help_text, [({"stage": s["name"]}, s.get(key)) for s in r["stages"]])
+        for key, value in r.get("metrics", {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauge(f"metric_{key.lower()}", f"{key} of the last run", [({}, value)])
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            fh.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+        return path
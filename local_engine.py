@@ -0,0 +1,146 @@
+"""In-process pandas/NumPy/scikit-learn engine for small inputs.
+
+For inputs of a few thousand rows, almost all of a Spark run is JVM startup
+and task scheduling. This engine runs the train pipeline without a
+SparkSession. It reads the CSV with pandas, builds the same features with
+the pandas counterparts of the Spark feature code (same column names and
+values), fits a scikit-learn GradientBoostingRegressor configured like the
+Spark GBT, and writes the same outputs: the prediction store with its
+conformal prediction intervals, the CSV sample and evaluation_metrics.json.
+The model is published as a pickled model version (model.pkl), because a
+Spark PipelineModel cannot be produced without Spark. Spark modes (score,
+forecast, stream, retrain) open it through `scoring.load_model`.
+
+`select_engine` picks this engine for train runs whose input files total at
+most `max_bytes`; everything else (and every other mode) runs on Spark.
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from backtesting import rollout_pandas, split_cutoff
+from calendar_features import add_calendar_features_pandas, calendar_feature_names
+from conformal import (DEFAULT_COVERAGES, add_intervals_pandas, calibrate_pandas, calibration_origins, coverage_pandas,
+                       save_calibration)
+from evaluation import evaluate_pandas, write_metrics
+from feature_engine import DEFAULT_LAGS, DEFAULT_WINDOWS, add_series_features_pandas, feature_names
+from ingestion import input_files, normalize_power_pandas, normalize_weather_pandas
+from instrumentation import stage
+from model_registry import ModelRegistry
+from prediction_store import write_store_pandas
+from weather_join import asof_join_pandas, fill_weather_gaps_pandas
+
+ENGINES = ("auto", "spark", "local")
+
+# inputs up to this size run in-process under --engine auto
+LOCAL_MAX_BYTES = 16 * 1024 * 1024
+
+# mirrors GBTRegressor(maxIter=50) with Spark's defaults (maxDepth=5, stepSize=0.1, squared loss)
+GBT_PARAMS = {"n_estimators": 50, "max_depth": 5, "learning_rate": 0.1, "random_state": 42}
+
+
+def input_bytes(paths):
+    return sum(os.path.getsize(f) for p in paths if p for f in input_files(p))
+
+
+def select_engine(requested, paths, max_bytes=LOCAL_MAX_BYTES, supported=True):
+    """Resolve --engine: 'auto' runs small inputs locally when the run can be done without Spark."""
+    if requested not in ENGINES:
+        raise ValueError(f"Unknown engine {requested!r} (expected one of {ENGINES})")
+    if requested == "local" and not supported:
+        raise ValueError("The local engine only supports --mode train without --per-series/--export-scorer")
+    if requested != "auto":
+        return requested
+    return "local" if supported and input_bytes(paths) <= max_bytes else "spark"
+
+
+def create_features_pandas(power, weather=None, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, series_col="Apartment_ID",
+                           weather_mode="nearest", weather_tolerance="0 seconds", weather_interval="1 month", calendar=None,
+                           drop_unlabeled=True):
+    """pandas counterpart of `forecasting_app.create_features`."""
+    pdf = normalize_power_pandas(power)
+    if drop_unlabeled:
+        pdf = pdf.dropna(subset=["power"])
+    pdf = add_calendar_features_pandas(pdf, calendar=calendar)
+    pdf = add_series_features_pandas(pdf, series_col=series_col, lags=lags, windows=windows)
+
+    if weather is not None:
+        weather = normalize_weather_pandas(weather)
+        pdf = asof_join_pandas(pdf, weather, mode=weather_mode, tolerance=weather_tolerance, interval=weather_interval)
+        pdf = fill_weather_gaps_pandas(pdf, weather)
+
+    candidate_features = [*calendar_feature_names(calendar), *feature_names(lags, windows), "temperature", "humidity", "cloud_cover"]
+    available = [c for c in candidate_features if c in pdf.columns]
+    keys = [series_col] if series_col and series_col in pdf.columns else []
+    pdf = pdf[[*keys, "timestamp", "power", *available]]
+    pdf = pdf.fillna({c: 0 for c in available})
+    return pdf.rename(columns={"power": "target"}).reset_index(drop=True)
+
+
+def feature_columns_pandas(pdf):
+    numeric = [c for c in pdf.columns if c != "target" and pd.api.types.is_numeric_dtype(pdf[c])
+               and not pd.api.types.is_bool_dtype(pdf[c])]
+    if not numeric:
+        raise RuntimeError("No numeric features available for training")
+    return numeric
+
+
+def train_and_evaluate_local(pdf, output_dir, model_name="gbt_model", series_col="Apartment_ID", report=None, data=None,
+                             coverages=DEFAULT_COVERAGES, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, period="1 month",
+                             calendar=None, max_horizon=12):
+    """In-process counterpart of `forecasting_app.train_and_evaluate`; returns (metrics, preds_path, model_path)."""
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    # time-ordered split: the last 20% of periods are held out
+    periods = list(np.sort(pdf["timestamp"].dropna().unique()))
+    cutoff = split_cutoff(periods, test_fraction=0.2)
+    train, test = pdf[pdf["timestamp"] <= cutoff], pdf[pdf["timestamp"] > cutoff]
+    features = feature_columns_pandas(pdf)
+    keys = [series_col] if series_col and series_col in pdf.columns else []
+
+    with stage(report, "fit") as st:
+        st["rows_in"] = len(train)
+        model = GradientBoostingRegressor(**GBT_PARAMS).fit(train[features].to_numpy(dtype=np.float64),
+                                                            train["target"].to_numpy(dtype=np.float64))
+
+    calibration = None
+    origins, until = calibration_origins(periods, cutoff)
+    if coverages and origins:
+        with stage(report, "calibrate") as st:
+            # h-step residuals of rollouts over the first half of the holdout (see conformal.py)
+            residuals = rollout_pandas(pdf, model, features, origins, min(len(origins), max_horizon), series_col=series_col,
+                                       lags=lags, windows=windows, period=period, calendar=calendar, until=until)
+            calibration = calibrate_pandas(residuals, coverages, keys, cutoff, until, len(origins))
+            st["rows_in"] = calibration["residuals"]
+
+    predictions = test[[*keys, "timestamp", "target"]].copy()
+    predictions["prediction"] = model.predict(test[features].to_numpy(dtype=np.float64))
+    if calibration is not None:
+        predictions["band_in_sample"] = predictions["timestamp"] <= until
+        predictions = add_intervals_pandas(predictions, calibration)
+
+    # outputs go into the version directory; the registry exposes them in output_dir once it is current
+    versions = ModelRegistry.for_model(output_dir, model_name)
+    with versions.staging() as staging:
+        with stage(report, "write"):
+            write_store_pandas(predictions, os.path.join(staging, "predictions.parquet"), series_col)
+            predictions.head(500).to_csv(os.path.join(staging, "predictions_sample.csv"), index=False)
+
+        with stage(report, "evaluate") as st:
+            metrics, by_series = evaluate_pandas(predictions, keys)
+            if calibration is not None:
+                metrics.update(coverage_pandas(predictions, calibration))
+            st["rows_in"] = metrics["rows"]
+            write_metrics(metrics, by_series, staging)
+
+        with stage(report, "publish"):
+            with open(os.path.join(staging, "model.pkl"), "wb") as fh:
+                pickle.dump({"model": model, "features": features}, fh)
+            if calibration is not None:
+                save_calibration(calibration, staging)
+            data = {**(data or {}), "through": str(pdf["timestamp"].max())}
+            version = versions.publish(staging, "sklearn", "model.pkl", metrics, by_series, data=data)
+
+    return metrics, versions.output_path(version, "predictions.parquet"), versions.artifact_path(version)
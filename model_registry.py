@@ -0,0 +1,183 @@
+"""Versioned, atomically published model checkpoints.
+
+Each trained model is published as an immutable version directory,
+`<output-dir>/models/<model-name>/vNNNN/`. It holds the artifact (a Spark
+PipelineModel, a per-series registry table or a pickled scikit-learn model)
+and `metrics.json`, the overall and per-series holdout metrics the model was
+published with. `registry.json` lists every version with its data version
+and metrics, plus the `current` version that readers load.
+
+Training writes its holdout outputs (OUTPUTS: the prediction store, the CSV
+sample and evaluation_metrics.json) into the version directory too. Only
+when a version becomes current, on publish, promote or rollback, are they
+copied to the top of the output directory, so a candidate that is not
+promoted never replaces the outputs of the model being served.
+
+A model is written to a staging directory first and renamed into place, and
+`registry.json` is replaced with `os.replace`. A reader that resolved a
+version therefore never sees it change or disappear halfway through a load,
+and rolling back only moves the `current` pointer.
+"""
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# retrain checks kept in registry.json
+MAX_CHECKS = 200
+
+# holdout outputs stored with a version and exposed in the output directory while it is current
+OUTPUTS = ("predictions.parquet", "predictions_sample.csv", "evaluation_metrics.json")
+
+
+def _replace(src, dst):
+    """Copy `src` (file or directory) over `dst`; `dst` is swapped in with renames, never left half-written."""
+    tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+    if os.path.isdir(src):
+        shutil.copytree(src, tmp)
+    else:
+        shutil.copy2(src, tmp)
+    if os.path.isdir(dst):
+        # os.replace cannot overwrite a non-empty directory
+        old = f"{dst}.{uuid.uuid4().hex}.old"
+        os.replace(dst, old)
+        os.replace(tmp, dst)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(tmp, dst)
+
+
+class ModelRegistry:
+    def __init__(self, root, output_dir=None):
+        self.root = root
+        self.index_path = os.path.join(root, "registry.json")
+        # where the current version's OUTPUTS are exposed (None: not exposed)
+        self.output_dir = output_dir
+
+    @classmethod
+    def for_model(cls, output_dir, model_name):
+        return cls(os.path.join(output_dir, "models", model_name), output_dir)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return {"current": None, "versions": [], "checks": []}
+        with open(self.index_path) as fh:
+            return json.load(fh)
+
+    def _save(self, index):
+        tmp = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(index, fh, indent=2, default=str)
+        os.replace(tmp, self.index_path)
+
+    def versions(self):
+        return self._load()["versions"]
+
+    def version(self, number):
+        found = next((v for v in self.versions() if v["version"] == number), None)
+        if found is None:
+            raise ValueError(f"No model version {number} in {self.root}")
+        return found
+
+    def current(self):
+        """Metadata of the version readers should load (None before the first publish)."""
+        number = self._load()["current"]
+        return self.version(number) if number is not None else None
+
+    def version_dir(self, number):
+        return os.path.join(self.root, f"v{number:04d}")
+
+    def artifact_path(self, meta):
+        return os.path.join(self.version_dir(meta["version"]), meta["artifact"])
+
+    def output_path(self, meta, name):
+        """Path of one of the OUTPUTS inside the version directory."""
+        return os.path.join(self.version_dir(meta["version"]), name)
+
+    def _expose(self, number):
+        if self.output_dir is None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name in OUTPUTS:
+            src = os.path.join(self.version_dir(number), name)
+            if os.path.exists(src):
+                _replace(src, os.path.join(self.output_dir, name))
+
+    def metrics(self, meta):
+        """Overall and per-series metrics stored with a version."""
+        with open(os.path.join(self.version_dir(meta["version"]), "metrics.json")) as fh:
+            return json.load(fh)
+
+    @contextmanager
+    def staging(self):
+        """Scratch directory for a new version; removed unless it is published."""
+        path = os.path.join(self.root, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(path)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def publish(self, staging, kind, artifact, metrics, by_series=(), data=None, promote=True, note=None):
+        """Rename `staging` (holding `artifact`) into the next version directory; return the version metadata."""
+        with open(os.path.join(staging, "metrics.json"), "w") as fh:
+            json.dump({"overall": metrics, "by_series": list(by_series)}, fh, indent=2, default=str)
+        index = self._load()
+        number = max((v["version"] for v in index["versions"]), default=0) + 1
+        os.replace(staging, self.version_dir(number))
+        meta = {
+            "version": number,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "kind": kind,
+            "artifact": artifact,
+            "metrics": metrics,
+            "data": data or {},
+            "parent": index["current"],
+            "note": note,
+        }
+        index["versions"].append(meta)
+        if promote:
+            self._expose(number)
+            index["current"] = number
+        self._save(index)
+        return meta
+
+    def promote(self, number):
+        index = self._load()
+        if not any(v["version"] == number for v in index["versions"]):
+            raise ValueError(f"No model version {number} in {self.root}")
+        self._expose(number)
+        index["current"] = number
+        self._save(index)
+        return self.version(number)
+
+    def rollback(self, number=None):
+        """Make `number` current, or by default the version the current one replaced."""
+        if number is None:
+            current = self.current()
+            if current is None or current["parent"] is None:
+                raise ValueError(f"Nothing to roll back to in {self.root}")
+            number = current["parent"]
+        return self.promote(number)
+
+    def log_check(self, entry):
+        index = self._load()
+        index["checks"] = (index["checks"] + [{"time": datetime.now(timezone.utc).isoformat(), **entry}])[-MAX_CHECKS:]
+        self._save(index)
+
+    def checked(self, data_version):
+        """Whether a retrain check already ran on `data_version`."""
+        return any(c.get("data_version") == data_version for c in self._load()["checks"])
+
+
+def resolve_model_path(output_dir, model_name, explicit=None):
+    """`explicit`, else the current registry version, else the legacy `<output-dir>/<model-name>` path."""
+    if explicit:
+        return explicit
+    registry = ModelRegistry.for_model(output_dir, model_name)
+    current = registry.current()
+    if current is not None:
+        return registry.artifact_path(current)
+    return os.path.join(output_dir, model_name)
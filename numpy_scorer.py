@@ -0,0 +1,73 @@
+"""JVM-free scorer for GBT models exported with `gbt_export.export_gbt`.
+
+Only NumPy is needed: the ensemble is stored as flat node arrays, and a batch
+of rows is pushed through every tree at once, one tree level per step, so
+scoring cost grows with tree depth rather than with the number of rows or
+trees in Python.
+
+Example:
+  from numpy_scorer import GBTScorer
+  scorer = GBTScorer.load("outputs/forecasts/gbt_model.npz")
+  preds = scorer.predict_frame(pandas_df)   # uses scorer.feature_cols
+"""
+import json
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class GBTScorer:
+    """Sum of weighted regression trees over a feature matrix in `feature_cols` order."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, weights, max_depth, feature_cols):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.weights = weights
+        self.max_depth = max_depth
+        self.feature_cols = list(feature_cols)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format_version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported scorer file version {meta.get('format_version')} in {path}")
+            return cls(
+                feature=data["feature"],
+                threshold=data["threshold"],
+                left=data["left"],
+                right=data["right"],
+                value=data["value"],
+                roots=data["roots"],
+                weights=data["weights"],
+                max_depth=meta["max_depth"],
+                feature_cols=meta["feature_cols"],
+            )
+
+    def predict(self, X):
+        """Predict for a 2-D array whose columns follow `feature_cols`."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_cols):
+            raise ValueError(f"Expected an array of shape (n, {len(self.feature_cols)}), got {X.shape}")
+        rows = np.arange(X.shape[0])[:, None]
+        # current node of every (row, tree) pair; leaves have left == -1 and stay put
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            is_leaf = self.left[node] < 0
+            if is_leaf.all():
+                break
+            go_left = X[rows, np.maximum(self.feature[node], 0)] <= self.threshold[node]
+            node = np.where(is_leaf, node, np.where(go_left, self.left[node], self.right[node]))
+        return self.value[node] @ self.weights
+
+    def predict_frame(self, frame):
+        """Predict for a pandas DataFrame (or mapping of column -> values) holding `feature_cols`."""
+        missing = [c for c in self.feature_cols if c not in frame]
+        if missing:
+            raise KeyError(f"Missing feature columns: {missing}")
+        return self.predict(np.column_stack([np.asarray(frame[c], dtype=np.float64) for c in self.feature_cols]))
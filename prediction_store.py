@@ -0,0 +1,128 @@
+"""Query-ready store of predictions and actuals, partitioned by series and year.
+
+Spark writes the store as `<path>/<series>=<id>/year=YYYY/part-*.parquet`.
+Each partition is one file, sorted by timestamp, with Parquet min/max
+statistics on every column. Timestamps are stored without a time zone, so
+readers see the same wall-clock periods as Spark.
+
+`read_predictions` answers "series X, dates A..B" with pyarrow alone: the
+series and year filters prune directories, and the timestamp filter is
+pushed down to row-group statistics. Only the matching files are opened,
+and no SparkSession or JVM is needed, so a dashboard can serve any meter in
+milliseconds.
+
+Example:
+  from prediction_store import read_predictions
+  df = read_predictions("outputs/forecasts/predictions.parquet", series="Apt_7",
+                        start="2023-01-01", end="2023-12-31", as_pandas=True)
+"""
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+YEAR_COL = "year"
+
+
+def write_store(predictions, path, series_col="Apartment_ID"):
+    """Write a Spark frame with `timestamp`, `target` and `prediction` (plus the series column) as the store."""
+    # imported here so that readers do not need pyspark
+    from pyspark.sql.functions import col, year
+
+    keys = [series_col] if series_col and series_col in predictions.columns else []
+    parts = [*keys, YEAR_COL]
+    (predictions
+     .withColumn("timestamp", col("timestamp").cast("timestamp_ntz"))
+     .withColumn(YEAR_COL, year("timestamp"))
+     # one task (and file) per partition, rows in time order for tight row-group statistics
+     .repartition(*parts)
+     .sortWithinPartitions(*parts, "timestamp")
+     .write.mode("overwrite")
+     .partitionBy(*parts)
+     .parquet(path))
+    return path
+
+
+def write_store_pandas(pdf, path, series_col="Apartment_ID"):
+    """pandas counterpart of `write_store`, for the in-process engine (same layout, readable by both)."""
+    import pyarrow.parquet as pq
+
+    keys = [series_col] if series_col and series_col in pdf.columns else []
+    pdf = pdf.sort_values([*keys, "timestamp"], kind="stable")
+    pdf = pdf.assign(timestamp=pdf["timestamp"].astype("datetime64[us]"),
+                     **{YEAR_COL: pdf["timestamp"].dt.year.astype("int32")})
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    pq.write_to_dataset(pa.Table.from_pandas(pdf, preserve_index=False), path, partition_cols=[*keys, YEAR_COL],
+                        basename_template="part-{i}.parquet")
+    return path
+
+
+def partition_columns(path):
+    """Partition column names of a store, outermost first, from its directory layout."""
+    names = []
+    level = path
+    while True:
+        subdirs = sorted(d for d in os.listdir(level) if "=" in d and os.path.isdir(os.path.join(level, d)))
+        if not subdirs:
+            return names
+        names.append(subdirs[0].split("=", 1)[0])
+        level = os.path.join(level, subdirs[0])
+
+
+def open_store(path):
+    """pyarrow Dataset over the store; series ids are read as strings and years as integers."""
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No prediction store at {path}")
+    fields = [pa.field(c, pa.int32() if c == YEAR_COL else pa.string()) for c in partition_columns(path)]
+    return ds.dataset(path, format="parquet", partitioning=ds.partitioning(pa.schema(fields), flavor="hive"),
+                      exclude_invalid_files=True)
+
+
+def list_series(path):
+    """Series ids in the store, read from directory names only."""
+    series = partition_columns(path)[:-1]
+    if not series:
+        return []
+    prefix = f"{series[0]}="
+    return sorted(d[len(prefix):] for d in os.listdir(path) if d.startswith(prefix))
+
+
+def read_predictions(path, series=None, start=None, end=None, columns=None, as_pandas=False):
+    """Rows of one series (or a list of them) with `start <= timestamp <= end`, as an Arrow table.
+
+    `start`/`end` may be strings, datetimes or pandas Timestamps; either can be omitted.
+    """
+    dataset = open_store(path)
+    names = dataset.schema.names
+    series_col = next((c for c in partition_columns(path) if c != YEAR_COL), None)
+
+    expr = None
+
+    def where(cond):
+        nonlocal expr
+        expr = cond if expr is None else expr & cond
+
+    if series is not None:
+        if series_col is None:
+            raise ValueError("Store is not partitioned by series")
+        ids = [series] if isinstance(series, (str, int)) else list(series)
+        where(ds.field(series_col).isin([str(s) for s in ids]))
+    ts_type = dataset.schema.field("timestamp").type
+    if start is not None:
+        start = pa.scalar(pd.Timestamp(start).to_pydatetime(), type=ts_type)
+        where(ds.field(YEAR_COL) >= start.as_py().year)
+        where(ds.field("timestamp") >= start)
+    if end is not None:
+        end = pa.scalar(pd.Timestamp(end).to_pydatetime(), type=ts_type)
+        where(ds.field(YEAR_COL) <= end.as_py().year)
+        where(ds.field("timestamp") <= end)
+
+    if columns is None:
+        columns = [c for c in names if c == series_col] + [c for c in names if c not in (series_col, YEAR_COL)]
+    table = dataset.to_table(columns=columns, filter=expr)
+    if "timestamp" in table.column_names:
+        table = table.sort_by([(c, "ascending") for c in (series_col, "timestamp") if c in table.column_names])
+    return table.to_pandas() if as_pandas else table
@@ -0,0 +1,146 @@
+"""Change-driven retraining against the model registry.
+
+`retrain` is meant to run on every data drop, e.g. nightly. It refits only
+when there is something to fix:
+
+1. If the data version (content hash of the inputs) matches the current
+   model's version, or was already checked, nothing runs.
+2. The current model scores the periods after the last one in the data it
+   was published from (or the last `drift_periods` periods when no new
+   periods arrived).
+   A series drifts when its MAE on those residuals exceeds its published
+   holdout MAE by more than `threshold` (0.25 = 25% worse), or when the
+   model has never seen it.
+3. Without drift, the check is recorded and nothing is retrained.
+   Otherwise a candidate is trained: per-series registries refit only the
+   drifting series and keep the other models, while a global pipeline
+   model is refitted as a whole.
+4. The candidate is published as a new version. Both models are then
+   scored on the gate window: the periods after the current model's data
+   (`through`) and after the candidate's training cutoff, so neither was
+   fitted on them. A tuned current model is refitted on all of its data,
+   so its published holdout metrics may be in-sample and are not used. The
+   candidate becomes current only if its RMSE on the window is no worse;
+   otherwise it stays available for `rollback --version N`. With fewer
+   than `gate_periods` such periods there is nothing fair to compare on:
+   the gate is skipped and the candidate, fitted because the current model
+   drifted, becomes current.
+"""
+import pandas as pd
+from pyspark.sql.functions import col, lit
+
+from backtesting import distinct_periods, split_cutoff
+from evaluation import evaluate
+from per_series import predict_registry
+from scoring import load_model
+
+DRIFT_THRESHOLD = 0.25
+DRIFT_PERIODS = 3
+GATE_PERIODS = 3
+
+
+def predict_with(registry, meta, df, features, group_col="Apartment_ID"):
+    """Predictions of the registry version `meta` for the feature rows `df`."""
+    path = registry.artifact_path(meta)
+    keys = [c for c in (group_col,) if c in df.columns]
+    if meta["kind"] == "per_series":
+        return predict_registry(df, df.sparkSession.read.parquet(path), features, group_col)
+    if meta["kind"] in ("pipeline", "sklearn"):
+        return load_model(path).transform(df).select(*keys, "timestamp", "target", "prediction")
+    raise ValueError(f"Cannot score model version {meta['version']} of kind {meta['kind']!r} on Spark")
+
+
+def recent_rows(df, through, drift_periods=DRIFT_PERIODS):
+    """Rows after `through`, or the last `drift_periods` periods when there are none."""
+    if through:
+        new = df.where(col("timestamp") > lit(through).cast("timestamp"))
+        if new.limit(1).count():
+            return new
+    periods = distinct_periods(df)[-drift_periods:]
+    return df.where(col("timestamp") >= lit(periods[0]))
+
+
+def gate_window(periods, through, test_fraction=0.2):
+    """Periods after both `through` and the training cutoff of a candidate fitted on `periods`."""
+    start = split_cutoff(periods, test_fraction)
+    if through:
+        start = max(pd.Timestamp(start), pd.Timestamp(through))
+    return [p for p in periods if pd.Timestamp(p) > start]
+
+
+def drifted_series(recent, baseline, series_cols, threshold=DRIFT_THRESHOLD):
+    """Keys (tuples) of series whose recent MAE exceeds baseline MAE by more than `threshold`, with the ratios."""
+    base = {tuple(r[c] for c in series_cols): r.get("MAE") for r in baseline}
+    drifted = {}
+    for r in recent:
+        key = tuple(r[c] for c in series_cols)
+        before = base.get(key)
+        if before is None:
+            drifted[key] = None
+        elif r["MAE"] is not None and r["MAE"] > before * (1 + threshold):
+            drifted[key] = r["MAE"] / before if before else float("inf")
+    return drifted
+
+
+def retrain(df, registry, features, train, data, series_cols=("Apartment_ID",), threshold=DRIFT_THRESHOLD,
+            drift_periods=DRIFT_PERIODS, force=False, gate_periods=GATE_PERIODS):
+    """Run one retraining check; returns a summary dict (also logged in the registry).
+
+    `train(only, promote)` fits and publishes a candidate (only the series in `only` when it is not None)
+    and returns `(metrics, preds_path, model_path)`.
+    """
+    series_cols = [c for c in series_cols if c in df.columns]
+    group_col = series_cols[0] if series_cols else None
+    current = registry.current()
+    if current is None:
+        metrics, _, _ = train(None, True)
+        summary = {"action": "initial", "version": registry.current()["version"], "metrics": metrics}
+        registry.log_check({"data_version": data.get("version"), **summary})
+        return summary
+
+    if not force and (current["data"].get("version") == data.get("version") or registry.checked(data.get("version"))):
+        return {"action": "skip", "reason": "data version already checked", "version": current["version"]}
+
+    recent = recent_rows(df, current["data"].get("through"), drift_periods)
+    recent_overall, recent_by = evaluate(predict_with(registry, current, recent, features, group_col), series_cols)
+    baseline = registry.metrics(current)
+    if series_cols:
+        drifted = drifted_series(recent_by, baseline["by_series"], series_cols, threshold)
+    else:
+        drifted = drifted_series([recent_overall], [baseline["overall"]], [], threshold)
+
+    summary = {"data_version": data.get("version"), "version": current["version"], "recent": recent_overall,
+               "drifted": [{"series": list(k), "mae_ratio": v} for k, v in drifted.items()]}
+    if not drifted and not force:
+        registry.log_check({**summary, "action": "no_drift"})
+        return {**summary, "action": "no_drift"}
+
+    partial = current["kind"] == "per_series" and not force
+    only = [k[0] for k in drifted] if partial else None
+    metrics, _, _ = train(only, False)
+    candidate = registry.versions()[-1]
+
+    # both models on periods neither was fitted on; never the incumbent's own, possibly in-sample, metrics
+    window = gate_window(distinct_periods(df), current["data"].get("through"))
+    incumbent = challenger = None
+    if len(window) >= gate_periods:
+        unseen = df.where(col("timestamp") >= lit(window[0]))
+        incumbent, _ = evaluate(predict_with(registry, current, unseen, features, group_col), series_cols)
+        challenger, _ = evaluate(predict_with(registry, candidate, unseen, features, group_col), series_cols)
+        promoted = incumbent["RMSE"] is None or (challenger["RMSE"] is not None
+                                                 and challenger["RMSE"] <= incumbent["RMSE"])
+    else:
+        promoted = True
+    if promoted:
+        registry.promote(candidate["version"])
+
+    summary.update({
+        "action": "retrained" if promoted else "rejected",
+        "candidate": candidate["version"],
+        "refit_series": len(only) if only is not None else "all",
+        "candidate_metrics": metrics,
+        "gate": {"periods": len(window), "skipped": incumbent is None,
+                 "candidate": challenger, "incumbent": incumbent},
+    })
+    registry.log_check(summary)
+    return summary
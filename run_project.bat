@@ -1,6 +1,6 @@
 @echo off
 cd /d %~dp0
-start "Spark UI" python forecasting_app.py --power-csv power_consumption_2015_2024_no_building.csv --keep-ui
+start "Spark UI" python forecasting_app.py --power-csv power_consumption_2015_2024_no_building.csv --engine spark --keep-ui
 start "Upload Handler" python web_dashboard\upload_handler.py
 cd web_dashboard
 start "Web Dashboard" python -m http.server 8000
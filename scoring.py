@@ -0,0 +1,93 @@
+"""Batch scoring with a saved model, without retraining.
+
+Input rows go through the same `create_features` code as training, except
+that rows without a power reading are kept and scored with a null target.
+The saved pipeline is applied per partition, and predictions are written by the
+executors straight to the prediction store (Parquet partitioned by series
+and year, see prediction_store.py). Nothing but the distinct periods is
+collected to the driver, so the input can be far larger than driver memory.
+
+When the model was saved with a conformal calibration, the prediction
+interval columns are added, with the one-period-ahead (horizon 1) bands
+(see conformal.py).
+
+`load_model` is how every Spark consumer (score, forecast, stream, retrain)
+opens a model version. A PipelineModel is loaded as is. The local engine's
+pickled scikit-learn model (model.pkl) is wrapped in `LocalModel`, which
+offers the same `transform` by predicting per Arrow batch with
+`mapInPandas`.
+"""
+import pickle
+
+import numpy as np
+from pyspark.ml import PipelineModel
+from pyspark.ml.feature import VectorAssembler
+from pyspark.sql.types import DoubleType, StructField, StructType
+
+from conformal import add_intervals, load_calibration
+from prediction_store import write_store
+
+# artifact suffix of the local engine's scikit-learn models (see local_engine.py)
+LOCAL_MODEL_SUFFIX = ".pkl"
+
+
+class LocalModel:
+    """A scikit-learn model saved by the local engine, applied to Spark frames like a PipelineModel."""
+
+    def __init__(self, model, features):
+        self.model = model
+        self.features = list(features)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as fh:
+            saved = pickle.load(fh)
+        return cls(saved["model"], saved["features"])
+
+    def transform(self, df):
+        """`df` with a `prediction` column, computed on the executors."""
+        model, features = self.model, self.features
+        schema = StructType([*df.schema.fields, StructField("prediction", DoubleType())])
+
+        def predict(batches):
+            for pdf in batches:
+                if len(pdf):
+                    pdf["prediction"] = model.predict(pdf[features].to_numpy(dtype=np.float64))
+                else:
+                    pdf["prediction"] = np.empty(0, dtype=np.float64)
+                yield pdf
+
+        return df.mapInPandas(predict, schema)
+
+
+def load_model(path):
+    """The model saved at `path`: a PipelineModel, or a `LocalModel` for a local-engine model.pkl."""
+    if path.endswith(LOCAL_MODEL_SUFFIX):
+        return LocalModel.load(path)
+    return PipelineModel.load(path)
+
+
+def model_features(model):
+    """Input columns of the model: those of the pipeline's VectorAssembler, or a LocalModel's features."""
+    if isinstance(model, LocalModel):
+        return model.features
+    assembler = next((s for s in model.stages if isinstance(s, VectorAssembler)), None)
+    if assembler is None:
+        raise ValueError("Saved pipeline has no VectorAssembler stage")
+    return assembler.getInputCols()
+
+
+def score(df, model_path, output_path, series_col="Apartment_ID"):
+    """Apply the model at `model_path` to the feature frame `df` and write predictions to `output_path`."""
+    model = load_model(model_path)
+    missing = [c for c in model_features(model) if c not in df.columns]
+    if missing:
+        raise ValueError(f"Feature frame is missing model inputs {missing}; "
+                         "use the same --lags/--windows/--weather-csv as when the model was trained")
+
+    keys = [series_col] if series_col in df.columns else []
+    predictions = model.transform(df).select(*keys, "timestamp", "target", "prediction")
+    calibration = load_calibration(model_path)
+    if calibration is not None:
+        predictions = add_intervals(predictions, calibration)
+    return write_store(predictions, output_path, series_col=series_col)
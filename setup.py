@@ -9,7 +9,7 @@ setup(
     packages=find_packages(where='src'),
     package_dir={'': 'src'},
     install_requires=[
-        'pyspark>=3.0.0',
+        'pyspark>=3.5',
         'pandas>=1.0.0',
         'numpy>=1.18.0',
         'scikit-learn>=0.24.0',
@@ -0,0 +1,143 @@
+"""Structured Streaming mode: incremental features and forecasts for new readings.
+
+A file source watches a landing directory for power CSVs. Rows are grouped
+by series and passed to `applyInPandasWithState`, which keeps only the last
+`max(lags, windows)` observations of every series in state. New rows are
+merged into that short history, and the lag/rolling features for the
+series' next period are computed from it, so no trigger ever re-sorts the
+full history. Only series that received rows in a trigger emit a forecast.
+The next period is the last reading plus `calendar["period"]` (`--period`),
+stepped like forecast.py does.
+
+State starts empty. Pass the readings already known as `history` (stream
+mode does when `--power-csv` is given) to seed each series with its last
+observations the first time it receives rows. Without it, the first
+forecasts of a series have zero-filled lags until enough readings arrive.
+
+Forecasts are scored with a saved model (see scoring.load_model) in `foreachBatch` and
+written to `<output>/batch_id=N`, overwriting that batch on replay, so a
+restart from the checkpoint does not duplicate output. With a conformal
+`calibration` (see conformal.py) each forecast gets its horizon-1
+prediction intervals.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import col, desc, lit, row_number
+from pyspark.sql.streaming.state import GroupStateTimeout
+from pyspark.sql.window import Window
+
+from calendar_features import add_calendar_features, calendar_config, calendar_feature_names
+from conformal import add_intervals
+from feature_engine import DEFAULT_LAGS, DEFAULT_WINDOWS, add_series_features_pandas, feature_names
+from ingestion import normalize_power, power_schema, read_header
+from scoring import load_model, model_features
+from weather_join import interval_offset
+
+# header assumed for the landing directory when it is still empty at startup
+DEFAULT_POWER_HEADER = ["Apartment_ID", "Year", "Month", "Season", "Monthly_kWh"]
+
+# last observations of a series: epoch microseconds and power values
+STATE_SCHEMA = "timestamps array<bigint>, values array<double>"
+
+
+def next_period(last, period="1 month"):
+    """Timestamp of the period after `last`, for a series spaced by the Spark interval `period`."""
+    return last + interval_offset(period)
+
+
+def seed_state(history, series_col, depth):
+    """{series: (epoch microseconds, values)} of the last `depth` readings of every series in `history`."""
+    if series_col not in history.columns:
+        history = history.withColumn(series_col, lit("all"))
+    w = Window.partitionBy(series_col).orderBy(desc("timestamp"))
+    latest = (history.where(col("power").isNotNull())
+              .select(series_col, "timestamp", "power")
+              .withColumn("_rn", row_number().over(w)).where(col("_rn") <= depth).drop("_rn")
+              .toPandas())
+    latest = latest.sort_values([series_col, "timestamp"], kind="stable")
+    latest["timestamp"] = pd.to_datetime(latest["timestamp"]).astype("datetime64[us]").astype("int64")
+    return {str(k): (g["timestamp"].tolist(), g["power"].tolist()) for k, g in latest.groupby(series_col)}
+
+
+def _state_updater(series_col, lags, windows, period, seed):
+    depth = max(tuple(lags) + tuple(windows))
+    names = feature_names(lags, windows)
+
+    def update(key, batches, state):
+        frames = [b[["timestamp", "power"]].dropna() for b in batches]
+        stored = state.get if state.exists else seed.get(str(key[0]))
+        if stored is not None:
+            ts, values = stored
+            frames.insert(0, pd.DataFrame({"timestamp": pd.to_datetime(np.asarray(ts, dtype="int64"), unit="us"), "power": values}))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return
+        pdf = (pd.concat(frames, ignore_index=True)
+               .drop_duplicates("timestamp", keep="last")
+               .sort_values("timestamp", kind="stable")
+               .reset_index(drop=True))
+        pdf["timestamp"] = pd.to_datetime(pdf["timestamp"])
+        pdf["power"] = pdf["power"].astype("float64")
+
+        keep = pdf.tail(depth)
+        # epoch microseconds: state arrays may round-trip through float64, which is exact below 2**53
+        state.update((keep["timestamp"].astype("datetime64[us]").astype("int64").tolist(), keep["power"].tolist()))
+
+        # features of the next period come from a placeholder row appended after the history
+        target = pd.DataFrame({"timestamp": [next_period(pdf["timestamp"].iloc[-1], period)], "power": [np.nan]})
+        feats = add_series_features_pandas(pd.concat([keep, target], ignore_index=True), series_col=None,
+                                           lags=lags, windows=windows).tail(1)
+        feats.insert(0, series_col, key[0])
+        yield feats[[series_col, "timestamp", *names]]
+
+    return update
+
+
+def stream_forecasts(spark, landing_dir, model_path, output_path, checkpoint_dir, series_col="Apartment_ID",
+                     lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, trigger_seconds=60, once=False, calendar=None,
+                     calibration=None, history=None):
+    """Start the streaming query and return it (call `.awaitTermination()` to block).
+
+    `history` is an optional frame of (series, timestamp, power) readings that seeds the state of every series.
+    """
+    calendar = calendar or calendar_config()
+    model = load_model(model_path)
+    names = feature_names(lags, windows)
+    available = set(names) | set(calendar_feature_names(calendar))
+    missing = [c for c in model_features(model) if c not in available]
+    if missing:
+        raise ValueError(f"Streaming mode cannot provide model inputs {missing}; "
+                         "train without weather and with the same --lags/--windows")
+
+    try:
+        header = read_header(landing_dir)
+    except FileNotFoundError:
+        header = DEFAULT_POWER_HEADER
+    raw = spark.readStream.csv(landing_dir, header=True, schema=power_schema(header))
+    readings = normalize_power(raw)
+    if series_col not in readings.columns:
+        readings = readings.withColumn(series_col, lit("all"))
+
+    depth = max(tuple(lags) + tuple(windows))
+    seed = seed_state(history, series_col, depth) if history is not None else {}
+
+    out_schema = ", ".join([f"{series_col} string", "timestamp timestamp"] + [f"{n} double" for n in names])
+    features = (
+        readings.select(series_col, "timestamp", "power")
+        .groupBy(series_col)
+        .applyInPandasWithState(_state_updater(series_col, lags, windows, calendar["period"], seed), out_schema, STATE_SCHEMA,
+                                "update", GroupStateTimeout.NoTimeout)
+    )
+
+    def write_batch(batch, batch_id):
+        feats = add_calendar_features(batch, calendar=calendar).fillna(0)
+        preds = model.transform(feats).select(series_col, "timestamp", "prediction")
+        if calibration is not None:
+            preds = add_intervals(preds.withColumn("horizon", lit(1)), calibration).drop("horizon")
+        preds.write.mode("overwrite").parquet(os.path.join(output_path, f"batch_id={batch_id}"))
+
+    writer = features.writeStream.outputMode("update").option("checkpointLocation", checkpoint_dir).foreachBatch(write_batch)
+    writer = writer.trigger(availableNow=True) if once else writer.trigger(processingTime=f"{trigger_seconds} seconds")
+    return writer.start()
@@ -0,0 +1,190 @@
+"""Start, watch and stop the project's services.
+
+Every service whose dependencies are ready is started at once, and each one
+counts as up only when its readiness probe passes: an HTTP health endpoint,
+a TCP connect to its port, or the Spark UI listing the application. Startup
+therefore takes as long as the slowest service needs, not a fixed sleep.
+
+A single loop polls all processes and probes. A service that exits with an
+error, or is not ready within its `ready_timeout`, is reported right away
+and restarted after an exponential backoff, up to `max_restarts` times in a
+row. A service that exits cleanly (e.g. a batch job) counts as finished.
+On Ctrl+C, or once no service is left running, services are stopped in
+reverse start order: terminate, wait `stop_timeout`, then kill.
+"""
+import json
+import socket
+import subprocess
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+POLL_SECONDS = 0.25
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def tcp_probe(port, host="127.0.0.1"):
+    """Ready once something accepts connections on `port`."""
+    def probe():
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            return False
+    return probe
+
+
+def http_probe(url):
+    """Ready once `url` answers 200."""
+    def probe():
+        try:
+            with urlopen(url, timeout=1) as resp:
+                return resp.status == 200
+        except (URLError, OSError, ValueError):
+            return False
+    return probe
+
+
+def spark_ui_probe(app_name, ports=range(4040, 4046), host="127.0.0.1"):
+    """Ready once a Spark UI on one of `ports` lists an application called `app_name`."""
+    def probe():
+        for port in ports:
+            try:
+                with urlopen(f"http://{host}:{port}/api/v1/applications", timeout=1) as resp:
+                    if any(a.get("name") == app_name for a in json.load(resp)):
+                        return True
+            except (URLError, OSError, ValueError):
+                continue
+        return False
+    return probe
+
+
+class Service:
+    def __init__(self, name, command, probe=None, cwd=None, after=(), ready_timeout=120.0, max_restarts=5,
+                 stop_timeout=10.0):
+        self.name = name
+        self.command = command
+        self.probe = probe
+        self.cwd = cwd
+        self.after = tuple(after)
+        self.ready_timeout = ready_timeout
+        self.max_restarts = max_restarts
+        self.stop_timeout = stop_timeout
+
+        self.process = None
+        self.state = "pending"  # pending, starting, ready, backoff, finished, failed, stopped
+        self.started = None
+        self.failures = 0
+        self.retry_at = None
+
+
+class Supervisor:
+    def __init__(self, services, log=print):
+        self.services = list(services)
+        self.by_name = {s.name: s for s in self.services}
+        unknown = {d for s in self.services for d in s.after} - set(self.by_name)
+        if unknown:
+            raise ValueError(f"Unknown service dependencies {sorted(unknown)}")
+        self.log = log
+        self.order = []  # services in the order they were (first) started
+        self.began = None
+
+    def _start(self, service):
+        service.process = subprocess.Popen(service.command, cwd=service.cwd)
+        service.state = "starting"
+        service.started = time.monotonic()
+        if service not in self.order:
+            self.order.append(service)
+        self.log(f"{service.name}: started (pid {service.process.pid})")
+
+    def _fail(self, service, reason):
+        service.failures += 1
+        if service.failures > service.max_restarts:
+            service.state = "failed"
+            self.log(f"{service.name}: {reason}; giving up after {service.max_restarts} restarts")
+            return
+        delay = min(BACKOFF_SECONDS * 2 ** (service.failures - 1), MAX_BACKOFF_SECONDS)
+        service.state = "backoff"
+        service.retry_at = time.monotonic() + delay
+        self.log(f"{service.name}: {reason}; restarting in {delay:.1f}s")
+
+    def _deps_ready(self, service):
+        # a dependency that finished cleanly has done its job
+        return all(self.by_name[d].state in ("ready", "finished") for d in service.after)
+
+    def _step(self):
+        now = time.monotonic()
+        for s in self.services:
+            if s.state == "pending" and self._deps_ready(s):
+                self._start(s)
+            elif s.state == "backoff" and now >= s.retry_at:
+                self._start(s)
+            elif s.state in ("starting", "ready"):
+                code = s.process.poll()
+                if code == 0:
+                    s.state = "finished"
+                    self.log(f"{s.name}: exited")
+                elif code is not None:
+                    self._fail(s, f"exited with code {code}" + (" before it was ready" if s.state == "starting" else ""))
+                elif s.state == "starting":
+                    if s.probe is None or s.probe():
+                        s.state = "ready"
+                        s.failures = 0
+                        self.log(f"{s.name}: ready after {now - s.started:.1f}s")
+                    elif now - s.started > s.ready_timeout:
+                        self._stop(s)
+                        self._fail(s, f"not ready after {s.ready_timeout:.0f}s")
+
+    def start(self):
+        """Start everything; return True once all services are ready (False if one failed for good)."""
+        self.began = time.monotonic()
+        while True:
+            self._step()
+            if any(s.state == "failed" for s in self.services):
+                return False
+            if all(s.state in ("ready", "finished") for s in self.services):
+                self.log(f"all services ready after {time.monotonic() - self.began:.1f}s")
+                return True
+            time.sleep(POLL_SECONDS)
+
+    def watch(self):
+        """Keep restarting crashed services until none is left running."""
+        while any(s.state in ("pending", "starting", "ready", "backoff") for s in self.services):
+            self._step()
+            time.sleep(POLL_SECONDS)
+
+    def _stop(self, service):
+        process = service.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=service.stop_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def stop(self):
+        """Stop services in reverse start order."""
+        for service in reversed(self.order):
+            if service.process is not None and service.process.poll() is None:
+                self.log(f"{service.name}: stopping")
+                self._stop(service)
+            if service.state not in ("finished", "failed"):
+                service.state = "stopped"
+
+    def run(self, on_ready=None):
+        """Start, watch until Ctrl+C or until every service ended, then stop; returns True if nothing failed.
+
+        `on_ready()` is called once all services are ready.
+        """
+        try:
+            if self.start() and on_ready is not None:
+                on_ready()
+            self.watch()
+        except KeyboardInterrupt:
+            self.log("stopping all services...")
+        finally:
+            self.stop()
+        return not any(s.state == "failed" for s in self.services)
@@ -5,6 +5,7 @@ Test script to simulate frontend upload functionality.
 
 import os
 import sys
+import time
 import requests
 
 # Add the project root to the Python path
@@ -60,10 +61,18 @@ def test_upload():
         print(f"Upload response status: {response.status_code}")
         print(f"Upload response: {response.json()}")
         
+        # Uploads run in the background; poll the job until it finishes
+        job = response.json()
+        while job.get('state') in ('queued', 'running'):
+            time.sleep(2)
+            job = requests.get(f"http://localhost:5000/jobs/{job['id']}").json()
+            print(f"Job {job['id']}: {job['state']} ({job['stage'] or '-'}, {job['progress']:.0%})")
+        print(f"Job result: {job.get('result') or job.get('error')}")
+        
         # Clean up
         os.remove('sample_test_data.csv')
         
-        return response.status_code == 200
+        return response.status_code in (200, 202) and job.get('state') == 'succeeded'
         
     except Exception as e:
         print(f"Error in test: {str(e)}")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Parity check between the exported NumPy scorer and the Spark pipeline it came from.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from pyspark.ml import Pipeline, PipelineModel
+from pyspark.ml.feature import VectorAssembler
+from pyspark.ml.regression import GBTRegressor
+from pyspark.sql import SparkSession
+
+from gbt_export import export_gbt
+from numpy_scorer import GBTScorer
+
+
+def test_scorer_matches_pipeline():
+    """Train a small GBT pipeline, export it and compare predictions row by row."""
+    spark = SparkSession.builder.master("local[1]").appName("NumpyScorerParity").getOrCreate()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(42)
+        features = ["x1", "x2", "x3"]
+        pdf = pd.DataFrame(rng.normal(size=(300, 3)), columns=features)
+        # rounded inputs put many rows exactly on split thresholds, where <= vs < would show
+        pdf = pdf.round(1)
+        pdf["target"] = 3 * pdf["x1"] - pdf["x2"] ** 2 + np.where(pdf["x3"] > 0, 5.0, 0.0)
+        df = spark.createDataFrame(pdf)
+
+        pipeline = Pipeline(stages=[
+            VectorAssembler(inputCols=features, outputCol="features"),
+            GBTRegressor(featuresCol="features", labelCol="target", maxIter=10, maxDepth=4, seed=7),
+        ])
+        model_path = os.path.join(temp_dir, "model")
+        pipeline.fit(df).save(model_path)
+
+        expected = PipelineModel.load(model_path).transform(df).select("prediction").toPandas()["prediction"].to_numpy()
+
+        scorer = GBTScorer.load(export_gbt(spark, model_path))
+        assert scorer.feature_cols == features
+        actual = scorer.predict_frame(pdf)
+        np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_scorer_matches_pipeline()
+    print("\nNumPy scorer matches the Spark pipeline.")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Train with the default flags, then score with the model that became current.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from model_registry import ModelRegistry
+
+POWER_CSV = os.path.join(project_root, "power_consumption_2015_2024_no_building.csv")
+
+
+def run_app(*args):
+    subprocess.run([sys.executable, os.path.join(project_root, "forecasting_app.py"), *args], check=True,
+                   cwd=project_root)
+
+
+def test_train_then_score():
+    """The default train run (local engine for the bundled CSV) must leave a model every Spark mode can use."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        run_app("--power-csv", POWER_CSV, "--output-dir", temp_dir)
+        current = ModelRegistry.for_model(temp_dir, "gbt_model").current()
+        print(f"Current model: version {current['version']} ({current['kind']})")
+
+        run_app("--mode", "score", "--power-csv", POWER_CSV, "--output-dir", temp_dir)
+        scores = pd.read_parquet(os.path.join(temp_dir, "scores.parquet"))
+        assert len(scores) == len(pd.read_csv(POWER_CSV))
+        assert scores["prediction"].notna().all()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_train_then_score()
+    print("\nTrain and score completed successfully!")
@@ -0,0 +1,96 @@
+"""Parallel hyperparameter search for the GBT pipeline.
+
+The feature vector is assembled once and persisted, then every candidate
+GBTRegressor is fitted on that cached frame from a thread pool (one FAIR
+scheduler pool per candidate) and scored on a time-ordered validation split.
+The winning parameters are refitted on all history and saved as a regular
+PipelineModel (VectorAssembler + GBT), next to a leaderboard of every
+candidate. The version is published with the winner's overall and
+per-series validation metrics and the last period it was trained on, the
+baseline that `--mode retrain` checks for drift.
+"""
+import csv
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from pyspark.ml import PipelineModel
+from pyspark.ml.feature import VectorAssembler
+from pyspark.ml.regression import GBTRegressor
+from pyspark.sql.functions import abs as abs_, avg, col, max as max_
+
+from backtesting import time_split
+from evaluation import evaluate
+from feature_engine import series_keys
+from model_registry import ModelRegistry
+
+SEARCH_MODES = ("grid", "random")
+
+PARAM_GRID = {
+    "maxIter": [50, 100],
+    "maxDepth": [3, 5, 7],
+    "stepSize": [0.05, 0.1, 0.2],
+    "subsamplingRate": [0.7, 1.0],
+}
+
+
+def candidates(search="grid", n_samples=10, seed=42, grid=PARAM_GRID):
+    """Every combination of `grid` (search='grid') or `n_samples` of them drawn without replacement."""
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {search!r} (expected one of {SEARCH_MODES})")
+    keys = sorted(grid)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    if search == "random" and n_samples < len(combos):
+        combos = random.Random(seed).sample(combos, n_samples)
+    return combos
+
+
+def _fit_candidate(i, params, train, valid, seed):
+    train.sparkSession.sparkContext.setLocalProperty("spark.scheduler.pool", f"candidate{i}")
+    gbt = GBTRegressor(featuresCol="features", labelCol="target", seed=seed, **params)
+    model = gbt.fit(train)
+    err = col("prediction") - col("target")
+    row = model.transform(valid).agg(avg(err * err).alias("mse"), avg(abs_(err)).alias("mae")).first()
+    return {"candidate": i, **params, "RMSE": math.sqrt(row["mse"]), "MAE": row["mae"]}, model
+
+
+def tune(df, features, output_dir, model_name="gbt_model", search="grid", n_samples=10,
+         validation_fraction=0.2, parallelism=None, seed=42, data=None):
+    """Search GBT parameters, save the refitted winner and the leaderboard; return the leaderboard."""
+    assembler = VectorAssembler(inputCols=features, outputCol="features")
+    keys = series_keys(df)
+    assembled = assembler.transform(df).select(*keys, "timestamp", "target", "features").persist()
+    try:
+        train, valid = time_split(assembled, test_fraction=validation_fraction)
+        grid = candidates(search, n_samples, seed)
+        with ThreadPoolExecutor(max_workers=parallelism or min(len(grid), os.cpu_count() or 1)) as pool:
+            fitted = list(pool.map(lambda c: _fit_candidate(c[0], c[1], train, valid, seed), enumerate(grid)))
+        board = sorted((row for row, _ in fitted), key=lambda r: r["RMSE"])
+        best = {k: board[0][k] for k in PARAM_GRID}
+        # the winner's validation errors per series are the drift baseline for later retrain runs
+        winner, by_series = evaluate(fitted[board[0]["candidate"]][1].transform(valid), keys)
+        through = assembled.agg(max_("timestamp")).first()[0]
+        final = GBTRegressor(featuresCol="features", labelCol="target", seed=seed, **best).fit(assembled)
+    finally:
+        assembled.unpersist()
+
+    model = PipelineModel(stages=[assembler, final])
+    versions = ModelRegistry.for_model(output_dir, model_name)
+    with versions.staging() as staging:
+        model.write().save(os.path.join(staging, "model"))
+        data = {**(data or {}), "through": str(through)}
+        version = versions.publish(staging, "pipeline", "model", winner, by_series, data=data, note=f"tuned: {best}")
+    model_path = versions.artifact_path(version)
+
+    tuning_dir = os.path.join(output_dir, "tuning")
+    os.makedirs(tuning_dir, exist_ok=True)
+    with open(os.path.join(tuning_dir, "leaderboard.json"), "w") as fh:
+        json.dump({"search": search, "best": best, "leaderboard": board}, fh, indent=2)
+    with open(os.path.join(tuning_dir, "leaderboard.csv"), "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(board[0]))
+        writer.writeheader()
+        writer.writerows(board)
+    return board, model_path
@@ -0,0 +1,239 @@
+"""Background training jobs for uploaded power files.
+
+An upload returns a job id right away. The file is stored under its SHA-256
+and processed by a small thread pool (train on the first 80% of periods,
+predict and evaluate the rest, like `forecasting_app.train_and_evaluate`).
+Jobs report their current stage and a progress fraction, so the web
+dashboard can poll them.
+
+- Small files run on the in-process engine (see local_engine.py) and never
+  touch Spark. Larger ones share one SparkSession, created on first use and
+  kept for the life of the process. Each worker thread submits to its own
+  FAIR scheduler pool, so concurrent uploads share the executors instead of
+  queueing behind each other.
+- Results are cached by file hash in `<root>/results/<sha256>.json`.
+  Re-uploading a file returns its result immediately, even after a restart,
+  and uploading a file that is already queued or running returns that job.
+- At most `max_workers` jobs run at once. Beyond `max_pending` queued or
+  running jobs, `submit` raises QueueFull.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+from pyspark.sql import SparkSession
+
+from forecasting_app import create_features, load_csv, train_and_evaluate
+from ingestion import read_csv_pandas
+from local_engine import LOCAL_MAX_BYTES, create_features_pandas, select_engine, train_and_evaluate_local
+
+MAX_WORKERS = 2
+MAX_PENDING = 16
+
+# bump when the job pipeline changes what a cached result would contain
+RESULT_VERSION = 2
+
+# stages of a job, in order; progress is the fraction of them completed
+STAGES = ("ingestion", "features", "fit", "calibrate", "write", "evaluate", "publish")
+
+SAMPLE_ROWS = 20
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+class JobProgress:
+    """Stage reporter passed as `report` to the training functions; updates the job record."""
+
+    def __init__(self, jobs, job_id):
+        self.jobs = jobs
+        self.job_id = job_id
+
+    @contextmanager
+    def stage(self, name, **rows):
+        record = {"name": name, **rows}
+        self.jobs._update(self.job_id, stage=name)
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.time() - start
+            self.jobs._finish_stage(self.job_id, record)
+
+
+class UploadJobs:
+    def __init__(self, root="outputs/uploads", max_workers=MAX_WORKERS, max_pending=MAX_PENDING,
+                 local_max_bytes=LOCAL_MAX_BYTES, spark=None):
+        self.root = root
+        self.max_pending = max_pending
+        self.local_max_bytes = local_max_bytes
+        for d in ("files", "results", "jobs", "cache"):
+            os.makedirs(os.path.join(root, d), exist_ok=True)
+        self._spark = spark
+        self._spark_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}  # sha256 -> id of its queued or running job
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+
+    @property
+    def spark_started(self):
+        return self._spark is not None
+
+    def spark(self):
+        """The shared SparkSession, started by the first job that needs it."""
+        with self._spark_lock:
+            if self._spark is None:
+                self._spark = (SparkSession.builder.appName("PowerForecastUploads")
+                               .config("spark.scheduler.mode", "FAIR").getOrCreate())
+            return self._spark
+
+    def _result_path(self, sha):
+        return os.path.join(self.root, "results", f"{sha}.json")
+
+    def cached_result(self, sha):
+        path = self._result_path(sha)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fh:
+            result = json.load(fh)
+        return result if result.get("version") == RESULT_VERSION else None
+
+    def submit(self, data, filename="upload.csv"):
+        """Queue `data` (the uploaded file's bytes); return the job record (already finished when cached)."""
+        sha = hashlib.sha256(data).hexdigest()
+        job = {
+            "id": uuid.uuid4().hex[:16],
+            "file": filename,
+            "sha256": sha,
+            "bytes": len(data),
+            "state": "queued",
+            "stage": None,
+            "progress": 0.0,
+            "stages": [],
+            "engine": None,
+            "cached": False,
+            "submitted": _now(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        cached = self.cached_result(sha)
+        with self._lock:
+            if cached is not None:
+                job.update(state="succeeded", cached=True, progress=1.0, finished=job["submitted"], result=cached)
+                self._jobs[job["id"]] = job
+                return dict(job)
+            if sha in self._active:
+                return dict(self._jobs[self._active[sha]])
+            if len(self._active) >= self.max_pending:
+                raise QueueFull(f"{len(self._active)} uploads are already queued or running; try again later")
+            path = os.path.join(self.root, "files", f"{sha}.csv")
+            if not os.path.exists(path):
+                _write_atomic(path, data)
+            self._jobs[job["id"]] = job
+            self._active[sha] = job["id"]
+        self._pool.submit(self._run, job["id"], path)
+        return dict(job)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+    def pending(self):
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+        if self._spark is not None:
+            self._spark.stop()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _finish_stage(self, job_id, record):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["stages"] = job["stages"] + [record]
+            done = {s["name"] for s in job["stages"]}
+            job["progress"] = sum(1 for s in STAGES if s in done) / len(STAGES)
+
+    def _run(self, job_id, path):
+        self._update(job_id, state="running", started=_now())
+        sha = self.status(job_id)["sha256"]
+        try:
+            encoded = json.dumps(self._process(job_id, path, sha), indent=2, default=str)
+            _write_atomic(self._result_path(sha), encoded.encode())
+            result = json.loads(encoded)
+            self._update(job_id, state="succeeded", progress=1.0, stage=None, result=result, finished=_now())
+        except Exception as e:
+            self._update(job_id, state="failed", error=f"{type(e).__name__}: {e}", finished=_now())
+        finally:
+            with self._lock:
+                self._active.pop(sha, None)
+
+    def _process(self, job_id, path, sha):
+        progress = JobProgress(self, job_id)
+        output_dir = os.path.join(self.root, "jobs", sha[:16])
+        engine = select_engine("auto", [path], max_bytes=self.local_max_bytes)
+        self._update(job_id, engine=engine)
+        if engine == "local":
+            with progress.stage("ingestion") as st:
+                power = read_csv_pandas(path)
+                st["rows_out"] = len(power)
+            with progress.stage("features") as st:
+                pdf = create_features_pandas(power)
+                st["rows_out"] = len(pdf)
+            metrics, preds_path, model_path = train_and_evaluate_local(pdf, output_dir, report=progress)
+        else:
+            spark = self.spark()
+            # thread-local: this worker's jobs get their own FAIR pool
+            spark.sparkContext.setLocalProperty("spark.scheduler.pool", threading.current_thread().name)
+            with progress.stage("ingestion") as st:
+                power = load_csv(spark, path, cache_dir=os.path.join(self.root, "cache"))
+                st["rows_out"] = power.count()
+            with progress.stage("features") as st:
+                df = create_features(power).persist()
+                st["rows_out"] = df.count()
+            try:
+                metrics, preds_path, model_path = train_and_evaluate(df, output_dir, report=progress)
+            finally:
+                df.unpersist()
+
+        sample = pd.read_csv(os.path.join(output_dir, "predictions_sample.csv"), nrows=SAMPLE_ROWS)
+        sample = sample.astype(object).where(sample.notna(), None)
+        return {
+            "version": RESULT_VERSION,
+            "engine": engine,
+            "metrics": metrics,
+            "predictions_path": preds_path,
+            "model_path": model_path,
+            "sample": sample.to_dict("records"),
+        }
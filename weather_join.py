@@ -0,0 +1,164 @@
+"""As-of / tolerance-based join of weather onto power readings.
+
+Weather is tiny next to meter data, so instead of shuffling both sides for an
+exact timestamp join, weather rows are grouped into fixed-size time buckets.
+Each bucket also carries the rows of its neighbours, so a power row finds
+every candidate it may match by looking up its own bucket only. The bucket
+table is broadcast when it is small, and the best candidate is picked with
+native array functions on the power side, so the power data is never
+shuffled for the join.
+
+Modes:
+- nearest: closest weather reading within `tolerance` (0 = exact match)
+- last:    latest reading at or before the power timestamp, within `tolerance`
+- mean:    average of the readings inside the power interval [ts, ts + interval)
+
+`asof_join_pandas` gives the same result for the in-process engine, with
+`merge_asof` for nearest/last and cumulative sums for mean.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import (abs as abs_, aggregate, array_min, avg, broadcast, col, collect_list, explode, expr,
+                                   filter as filter_, floor, lit, sequence, struct, transform, unix_micros, when)
+
+JOIN_MODES = ("nearest", "last", "mean")
+
+# upper bounds in seconds; months and years are only used to size buckets
+UNITS = {
+    "second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400,
+    "month": 31 * 86400, "year": 366 * 86400,
+}
+
+MIN_BUCKET_SECONDS = 3600
+
+
+def parse_duration(value):
+    """Seconds in a duration such as '0', '90 minutes' or '1 month' (month = 31 days)."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-z]*?)s?\s*", value.lower())
+    if not m or (m.group(2) and m.group(2) not in UNITS):
+        raise ValueError(f"Cannot parse duration {value!r} (e.g. '30 minutes', '1 hour', '1 month')")
+    return float(m.group(1)) * UNITS.get(m.group(2) or "second")
+
+
+def interval_offset(value):
+    """pandas offset for a Spark interval such as '1 month' or '6 hours' (calendar months and years)."""
+    m = re.fullmatch(r"\s*(\d+)\s*(month|year)s?\s*", value.lower())
+    if m:
+        n = int(m.group(1))
+        return pd.DateOffset(months=n) if m.group(2) == "month" else pd.DateOffset(years=n)
+    return pd.Timedelta(seconds=parse_duration(value))
+
+
+def weather_value_columns(df_weather):
+    return [c for c, t in df_weather.dtypes if c != "timestamp" and t in ("int", "bigint", "double", "float")]
+
+
+def weather_value_columns_pandas(pdf):
+    return [c for c in pdf.columns if c != "timestamp" and pd.api.types.is_numeric_dtype(pdf[c])]
+
+
+def asof_join(df, df_weather, mode="nearest", tolerance="0 seconds", interval="1 month", broadcast_rows=5_000_000):
+    """Attach weather columns to `df` (both with a `timestamp` column); unmatched rows get nulls."""
+    if mode not in JOIN_MODES:
+        raise ValueError(f"Unknown weather join mode {mode!r} (expected one of {JOIN_MODES})")
+    values = weather_value_columns(df_weather)
+    reach_s = parse_duration(interval if mode == "mean" else tolerance)
+    bucket_us = int(max(reach_s, MIN_BUCKET_SECONDS) * 1_000_000)
+    reach_us = int(reach_s * 1_000_000)
+
+    # offsets of the power buckets each weather row must be visible from
+    if mode == "nearest":
+        offsets = (-1, 1)
+    elif mode == "last":
+        offsets = (0, 1)
+    else:
+        offsets = (-1, 0)
+
+    weather = df_weather.select(unix_micros("timestamp").alias("w_us"), *values).where(col("w_us").isNotNull())
+    buckets = (
+        weather
+        .withColumn("bucket", explode(sequence(floor(col("w_us") / bucket_us) + offsets[0],
+                                               floor(col("w_us") / bucket_us) + offsets[1])))
+        .groupBy("bucket")
+        .agg(collect_list(struct("w_us", *values)).alias("candidates"))
+    )
+    if weather.count() <= broadcast_rows:
+        buckets = broadcast(buckets)
+
+    p_us = unix_micros(col("timestamp"))
+    joined = df.withColumn("_bucket", floor(p_us / bucket_us)).join(
+        buckets, col("_bucket") == col("bucket"), "left")
+
+    if mode == "mean":
+        end_us = unix_micros(expr(f"timestamp + INTERVAL {interval}"))
+        inside = filter_("candidates", lambda x: (x["w_us"] >= p_us) & (x["w_us"] < end_us))
+        totals = []
+        for v in values:
+            totals.append(aggregate(
+                inside, struct(lit(0.0).alias("s"), lit(0).alias("n")),
+                lambda acc, x: when(x[v].isNull(), acc).otherwise(
+                    struct((acc["s"] + x[v]).alias("s"), (acc["n"] + 1).alias("n"))),
+            ).alias(f"_{v}"))
+        # project the sums first so each aggregate is evaluated once per row
+        joined = joined.select(*df.columns, *totals)
+        return joined.select(*df.columns, *[
+            when(col(f"_{v}.n") > 0, col(f"_{v}.s") / col(f"_{v}.n")).alias(v) for v in values])
+
+    def dist(x):
+        if mode == "nearest":
+            return abs_(x["w_us"] - p_us)
+        return p_us - x["w_us"]
+
+    # array_min over (distance, reading...) structs picks the closest reading
+    inside = filter_("candidates", lambda x: (dist(x) >= 0) & (dist(x) <= reach_us))
+    best = array_min(transform(inside, lambda x: struct(dist(x).alias("dist"), *[x[v].alias(v) for v in values])))
+    joined = joined.select(*df.columns, best.alias("_best"))
+    return joined.select(*df.columns, *[col(f"_best.{v}").alias(v) for v in values])
+
+
+def fill_weather_gaps(df, df_weather):
+    """Fill weather columns left null by the join with the weather table's means (instead of 0)."""
+    values = [c for c in weather_value_columns(df_weather) if c in df.columns]
+    if not values:
+        return df
+    means = df_weather.select(*[avg(c).alias(c) for c in values]).first().asDict()
+    return df.fillna({c: m for c, m in means.items() if m is not None})
+
+
+def asof_join_pandas(pdf, weather, mode="nearest", tolerance="0 seconds", interval="1 month"):
+    """pandas counterpart of `asof_join`; rows keep their order and index."""
+    if mode not in JOIN_MODES:
+        raise ValueError(f"Unknown weather join mode {mode!r} (expected one of {JOIN_MODES})")
+    values = weather_value_columns_pandas(weather)
+    w = weather[["timestamp", *values]].dropna(subset=["timestamp"]).sort_values("timestamp", kind="stable")
+    out = pdf.copy()
+
+    if mode == "mean":
+        # readings in [ts, ts + interval) via prefix sums over the sorted weather table
+        w_ts = w["timestamp"].to_numpy()
+        lo = np.searchsorted(w_ts, pdf["timestamp"].to_numpy(), "left")
+        hi = np.searchsorted(w_ts, (pdf["timestamp"] + interval_offset(interval)).to_numpy(), "left")
+        for v in values:
+            vals = w[v].to_numpy(dtype=np.float64)
+            ok = ~np.isnan(vals)
+            sums = np.concatenate([[0.0], np.cumsum(np.where(ok, vals, 0.0))])
+            counts = np.concatenate([[0], np.cumsum(ok)])
+            n = counts[hi] - counts[lo]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[v] = np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+        return out
+
+    left = pdf[["timestamp"]].dropna().sort_values("timestamp", kind="stable").rename_axis("_row").reset_index()
+    matched = pd.merge_asof(left, w, on="timestamp", direction="nearest" if mode == "nearest" else "backward",
+                            tolerance=pd.Timedelta(seconds=parse_duration(tolerance))).set_index("_row")
+    for v in values:
+        out[v] = matched[v]
+    return out
+
+
+def fill_weather_gaps_pandas(pdf, weather):
+    """pandas counterpart of `fill_weather_gaps`."""
+    values = [c for c in weather_value_columns_pandas(weather) if c in pdf.columns]
+    return pdf.fillna({c: weather[c].mean() for c in values if pd.notna(weather[c].mean())})
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Upload handler for the PowerForecast web dashboard (http://localhost:5000).
+
+POST /upload queues the file and answers 202 with the job record; poll
+GET /jobs/<id> for its state, stage and progress, and for the metrics and a
+prediction sample once it has succeeded. A file that was processed before
+answers 200 with its cached result straight away; a full queue answers 429.
+Jobs run in the background on a shared worker pool and SparkSession, see
+upload_jobs.py.
+"""
+import argparse
+import os
+import sys
+
+from flask import Flask, jsonify, request
+
+try:
+    from flask_cors import CORS
+except ImportError:  # the dashboard can also be served from this origin
+    CORS = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from upload_jobs import MAX_PENDING, MAX_WORKERS, QueueFull, UploadJobs  # noqa: E402
+
+app = Flask(__name__)
+if CORS is not None:
+    CORS(app)
+
+jobs = None
+
+
+@app.get("/health")
+def health():
+    return jsonify({"status": "ok", "pending_jobs": jobs.pending(), "spark_started": jobs.spark_started})
+
+
+@app.post("/upload")
+def upload():
+    uploaded = request.files.get("file")
+    if uploaded is None or not uploaded.filename:
+        return jsonify({"error": "no file uploaded (expected form field 'file')"}), 400
+    try:
+        job = jobs.submit(uploaded.read(), uploaded.filename)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    status = 200 if job["state"] == "succeeded" else 202
+    return jsonify(job), status, {"Location": f"/jobs/{job['id']}"}
+
+
+@app.get("/jobs")
+def list_jobs():
+    return jsonify([{k: v for k, v in job.items() if k != "result"} for job in jobs.jobs()])
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": f"unknown job {job_id}"}), 404
+    return jsonify(job)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=5000)
+    p.add_argument("--root", default=os.path.join(PROJECT_ROOT, "outputs", "uploads"),
+                   help="Directory for uploaded files, job outputs and the result cache")
+    p.add_argument("--workers", type=int, default=MAX_WORKERS, help="Uploads processed concurrently")
+    p.add_argument("--max-pending", type=int, default=MAX_PENDING, help="Queued plus running uploads before 429s")
+    args = p.parse_args()
+
+    global jobs
+    jobs = UploadJobs(args.root, max_workers=args.workers, max_pending=args.max_pending)
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        jobs.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()